@@ -0,0 +1,334 @@
+"""
+Asyncio recommendation pipeline.
+
+Runs Places lookup, category mapping and ranking as concurrent stages
+joined by bounded queues, so network waits and CPU-bound ranking overlap
+and throughput is set by the slowest stage instead of the sum of all three:
+
+    input -> [lookup x lookup_concurrency] -> [map x map_concurrency] -> [rank] -> output
+
+Lookups run the blocking PlacesClient.lookup on a thread pool sized to the
+lookup concurrency, and mapping runs on its own map_concurrency-thread
+pool, so neither blocks the event loop. Ranking gathers whatever mapped rows
+are ready (up to rank_batch_size) into one rank_batch call on its own
+executor, which may be a thread or a process pool. Full queues block the
+stage feeding them, so a slow stage throttles everything upstream and
+memory stays bounded. Closing the output iterator or cancelling its task
+cancels every stage.
+
+Records have the same shape as bulk.recommend_rows.
+
+Usage:
+    python async_pipeline.py transactions.csv -o results.jsonl [--offline] [--lookup-concurrency 16]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Tuple, Union
+
+from bulk import _detect_format, _row_amount, _row_text, _row_types, fill_ranking, new_record, read_rows
+from map import USER_CARDS, categories_for_place
+from rewards_matrix import get_rewards_matrix
+
+DEFAULT_QUEUE_SIZE = 256
+DEFAULT_RANK_BATCH_SIZE = 128
+
+# Marks the end of a stage's output
+_DONE = object()
+
+Rows = Union[Iterable, AsyncIterable]
+
+
+def _record(index: int, row) -> Dict:
+    if isinstance(row, dict):
+        text, types, amount = _row_text(row), _row_types(row), _row_amount(row)
+    else:
+        text, types, amount = str(row or "").strip(), [], None
+    record = new_record(index, text, amount)
+    record["_types"] = types
+    return record
+
+
+async def _feed(rows: Rows, out: asyncio.Queue, workers: int, window: asyncio.Semaphore) -> None:
+    async def put(index, row):
+        # Caps rows in flight, so one slow lookup cannot grow the reorder buffer without bound
+        await window.acquire()
+        await out.put(_record(index, row))
+
+    index = 0
+    if hasattr(rows, "__aiter__"):
+        async for row in rows:
+            await put(index, row)
+            index += 1
+    else:
+        for row in rows:
+            await put(index, row)
+            index += 1
+    for _ in range(workers):
+        await out.put(_DONE)
+
+
+async def _stage(workers: int, body, inbox: asyncio.Queue, out: asyncio.Queue, downstream: int) -> None:
+    """Runs `workers` copies of body over inbox, then signals downstream once all finish."""
+
+    async def worker():
+        while True:
+            record = await inbox.get()
+            if record is _DONE:
+                return
+            await out.put(await body(record))
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    for _ in range(downstream):
+        await out.put(_DONE)
+
+
+async def _guard(stage, results: asyncio.Queue) -> None:
+    """Forwards a stage's crash to the consumer instead of leaving it waiting on output."""
+    try:
+        await stage
+    except Exception as exc:
+        await results.put(exc)
+
+
+def _load_matrix(matrix_csv_path: str) -> None:
+    get_rewards_matrix(matrix_csv_path)
+
+
+def _rank_rows(
+    matrix_csv_path: str, category_sets: List[List[str]], wallet: List[str], top_n: int
+) -> List[List[Tuple[str, float, str]]]:
+    """
+    Ranks one batch for one wallet. Module-level and returning plain data,
+    so it can run on a process pool as well as a thread pool (each process
+    keeps its own loaded matrix).
+    """
+    ranked = get_rewards_matrix(matrix_csv_path).rank_batch(category_sets, [wallet], top_n=top_n)
+    return [results[0] for results in ranked]
+
+
+async def recommend_stream(
+    rows: Rows,
+    card_whitelist: Optional[List[str]] = None,
+    client=None,
+    matrix_csv_path: str = "card_rewards_matrix.csv",
+    top_n: int = 3,
+    lookup_concurrency: int = 8,
+    map_concurrency: int = 1,
+    rank_batch_size: int = DEFAULT_RANK_BATCH_SIZE,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    max_in_flight: Optional[int] = None,
+    rank_executor: Optional[Executor] = None,
+    ordered: bool = True,
+) -> AsyncIterator[Dict]:
+    """
+    Streams one recommendation record per input row through the staged pipeline.
+
+    Args:
+        rows: Iterable or async iterable of address strings or row dicts
+            (see bulk.TEXT_FIELDS; optional "amount" and "types")
+        card_whitelist: Cards to rank (defaults to USER_CARDS)
+        client: PlacesClient; without one the row text is the place name and
+            the row's own "types" are used
+        matrix_csv_path: Path to rewards matrix CSV
+        top_n: Number of cards per record
+        lookup_concurrency: Lookups in flight at once
+        map_concurrency: Threads running categories_for_place
+        rank_batch_size: Most rows ranked per rank_batch call
+        queue_size: Capacity of each inter-stage queue
+        max_in_flight: Most rows read but not yet yielded (defaults to
+            4 * queue_size)
+        rank_executor: Thread or process pool for ranking (defaults to one
+            worker thread); with a process pool each worker loads the matrix once
+        ordered: Yield records in input order (otherwise as they finish)
+
+    Yields:
+        Dicts with row, input, amount, place, categories, top_cards,
+        estimated_rewards and error
+    """
+    # Stages count one end marker per upstream worker: with no workers
+    # nothing would consume the rows and every one would be dropped silently
+    for name, value in (("lookup_concurrency", lookup_concurrency), ("map_concurrency", map_concurrency)):
+        if value < 1:
+            raise ValueError(f"{name} must be at least 1, got {value}")
+    loop = asyncio.get_running_loop()
+    wallet = list(card_whitelist) if card_whitelist is not None else USER_CARDS
+    matrix_csv_path = os.path.abspath(matrix_csv_path)
+    lookup_pool = ThreadPoolExecutor(max_workers=lookup_concurrency) if client is not None else None
+    # Mapping is CPU work: keep it off the event loop that drives the lookups
+    map_pool = ThreadPoolExecutor(max_workers=map_concurrency)
+    own_rank_pool = rank_executor is None
+    rank_pool = rank_executor or ThreadPoolExecutor(max_workers=1)
+    # Load (or reuse) the matrix before any rows arrive
+    await loop.run_in_executor(rank_pool, _load_matrix, matrix_csv_path)
+
+    to_lookup: asyncio.Queue = asyncio.Queue(queue_size)
+    to_map: asyncio.Queue = asyncio.Queue(queue_size)
+    to_rank: asyncio.Queue = asyncio.Queue(queue_size)
+    finished: asyncio.Queue = asyncio.Queue(queue_size)
+    window = asyncio.Semaphore(max_in_flight or 4 * queue_size)
+
+    async def lookup(record: Dict) -> Dict:
+        if not record["input"]:
+            return record
+        if lookup_pool is None:
+            record["place"] = {"name": record["input"], "types": record["_types"]}
+            return record
+        try:
+            record["place"] = await loop.run_in_executor(lookup_pool, client.lookup, record["input"])
+        except Exception as exc:
+            record["error"] = str(exc)
+        return record
+
+    async def map_place(record: Dict) -> Dict:
+        place = record["place"]
+        if place is not None:
+            record["categories"] = await loop.run_in_executor(
+                map_pool, categories_for_place, place.get("name", ""), place.get("types", [])
+            )
+        return record
+
+    async def rank(batch: List[Dict]) -> None:
+        ranked = await loop.run_in_executor(
+            rank_pool, _rank_rows, matrix_csv_path, [r["categories"] for r in batch], wallet, top_n
+        )
+        for record, results in zip(batch, ranked):
+            fill_ranking(record, results)
+
+    async def rank_stage() -> None:
+        workers_left = map_concurrency
+        while workers_left:
+            batch = []
+            record = await to_rank.get()
+            # Take everything already waiting, up to the batch size, without blocking
+            while True:
+                if record is _DONE:
+                    workers_left -= 1
+                elif record["categories"]:
+                    batch.append(record)
+                else:
+                    await finished.put(record)
+                if len(batch) >= rank_batch_size or not workers_left or to_rank.empty():
+                    break
+                record = to_rank.get_nowait()
+            if batch:
+                await rank(batch)
+                for ranked in batch:
+                    await finished.put(ranked)
+        await finished.put(_DONE)
+
+    tasks = [
+        asyncio.ensure_future(_guard(stage, finished))
+        for stage in (
+            _feed(rows, to_lookup, lookup_concurrency, window),
+            _stage(lookup_concurrency, lookup, to_lookup, to_map, map_concurrency),
+            _stage(map_concurrency, map_place, to_map, to_rank, map_concurrency),
+            rank_stage(),
+        )
+    ]
+    pending: Dict[int, Dict] = {}
+    next_row = 0
+    try:
+        while True:
+            record = await finished.get()
+            if record is _DONE:
+                break
+            if isinstance(record, Exception):
+                raise record
+            record.pop("_types", None)
+            if not ordered:
+                window.release()
+                yield record
+                continue
+            pending[record["row"]] = record
+            while next_row in pending:
+                window.release()
+                yield pending.pop(next_row)
+                next_row += 1
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if lookup_pool is not None:
+            lookup_pool.shutdown(wait=False, cancel_futures=True)
+        map_pool.shutdown(wait=False, cancel_futures=True)
+        if own_rank_pool:
+            rank_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_pipeline(rows: Iterable, **kwargs) -> List[Dict]:
+    """Synchronous wrapper: runs recommend_stream to completion and returns every record."""
+
+    async def collect():
+        return [record async for record in recommend_stream(rows, **kwargs)]
+
+    return asyncio.run(collect())
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Stream recommendations through the async pipeline.")
+    parser.add_argument("input", help="CSV/JSONL of addresses or transactions")
+    parser.add_argument("-o", "--output", help="Output JSONL file (default: stdout)")
+    parser.add_argument("--offline", action="store_true", help="Map row text directly, without Places lookups")
+    parser.add_argument("--top-n", type=int, default=3)
+    parser.add_argument("--lookup-concurrency", type=int, default=8)
+    parser.add_argument("--map-concurrency", type=int, default=1)
+    parser.add_argument("--rank-batch-size", type=int, default=DEFAULT_RANK_BATCH_SIZE)
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE)
+    parser.add_argument("--rank-processes", type=int, default=0, help="Rank on this many processes (default: one thread)")
+    parser.add_argument("--matrix", default="card_rewards_matrix.csv", help="Rewards matrix CSV")
+    args = parser.parse_args(argv)
+    for flag in ("lookup_concurrency", "map_concurrency"):
+        if getattr(args, flag) < 1:
+            parser.error(f"--{flag.replace('_', '-')} must be at least 1")
+
+    client = None
+    if not args.offline:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        api_key = os.environ.get("GOOGLE_PLACES_API_KEY")
+        if not api_key:
+            print("Set GOOGLE_PLACES_API_KEY first (or pass --offline).")
+            return 1
+        from places import PlacesCache, PlacesClient
+
+        client = PlacesClient(api_key, cache=PlacesCache())
+
+    rank_executor = ProcessPoolExecutor(max_workers=args.rank_processes) if args.rank_processes > 0 else None
+
+    async def run() -> None:
+        out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            with open(args.input, newline="", encoding="utf-8") as f:
+                records = recommend_stream(
+                    read_rows(f, _detect_format(args.input)),
+                    client=client,
+                    matrix_csv_path=args.matrix,
+                    top_n=args.top_n,
+                    lookup_concurrency=args.lookup_concurrency,
+                    map_concurrency=args.map_concurrency,
+                    rank_batch_size=args.rank_batch_size,
+                    queue_size=args.queue_size,
+                    rank_executor=rank_executor,
+                )
+                async for record in records:
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+    try:
+        asyncio.run(run())
+    finally:
+        if rank_executor is not None:
+            rank_executor.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
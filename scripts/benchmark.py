@@ -0,0 +1,308 @@
+"""
+Benchmarks for the mapping and ranking hot paths.
+
+Generates synthetic rewards matrices (cards x columns at several scales) and
+synthetic places, then times each pipeline stage and reports throughput,
+p50/p99 latency and peak traced memory as JSON. Runs fully offline: the
+Places stage goes through PlacesClient with a stubbed HTTP transport.
+
+Usage:
+    python benchmark.py                              # default scales, JSON to stdout
+    python benchmark.py --scales 500x200 2000x500 --iterations 2000 -o bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import map_to_category
+from map_to_category import (
+    BRAND_OVERRIDES,
+    CATEGORIES,
+    TYPE_TO_CATEGORY,
+    build_search_terms,
+    map_place_to_categories,
+    map_place_to_category,
+)
+
+DEFAULT_SCALES = ["100x50", "500x200", "2000x500"]
+DEFAULT_ITERATIONS = 1000
+DEFAULT_SEED = 1234
+MEMORY_SAMPLE = 50
+
+_QUALIFIERS = ["", " (U.S.)", " (Amex Travel)", " (chase.com/travel)", " (up to $50k spend/yr)"]
+_FILLER_WORDS = ["Cafe", "Market", "Store", "Plaza", "Express", "Center", "Shop", "Outlet", "Co"]
+_RATES = [1.0, 1.5, 2.0, 3.0, 4.0, 5.0]
+
+
+# -----------------------------------------------------------------------------
+# Synthetic data
+# -----------------------------------------------------------------------------
+
+def synthetic_columns(n_columns: int, rng: random.Random) -> List[str]:
+    """Reward column names drawn from the real category list plus qualifiers."""
+    columns = ["Everywhere"]
+    seen = set(columns)
+    while len(columns) < n_columns:
+        name = rng.choice(CATEGORIES) + rng.choice(_QUALIFIERS)
+        if name in seen:
+            name = f"{name} #{len(columns)}"
+        seen.add(name)
+        columns.append(name)
+    return columns
+
+
+def write_synthetic_matrix(path: str, n_cards: int, n_columns: int, rng: random.Random) -> List[str]:
+    """Writes a sparse synthetic rewards matrix CSV and returns its card names."""
+    import csv
+
+    columns = synthetic_columns(n_columns, rng)
+    cards = [f"Synthetic Card {i}" for i in range(n_cards)]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Card Name"] + columns)
+        for card in cards:
+            row = [rng.choice([1.0, 1.5, 2.0])]  # base "Everywhere" rate
+            row += [rng.choice(_RATES) if rng.random() < 0.03 else 0.0 for _ in columns[1:]]
+            writer.writerow([card] + row)
+    return cards
+
+
+def synthetic_places(n: int, rng: random.Random) -> List[Tuple[str, List[str]]]:
+    """Place names and type lists: brand hits, type-only hits and long-tail misses."""
+    brands = list(BRAND_OVERRIDES)
+    types = list(TYPE_TO_CATEGORY) + ["point_of_interest", "establishment"]
+    places = []
+    for _ in range(n):
+        kind = rng.random()
+        if kind < 0.3:
+            name = f"{rng.choice(brands).title()} {rng.choice(_FILLER_WORDS)} #{rng.randint(1, 9999)}"
+        elif kind < 0.5:
+            name = rng.choice(CATEGORIES)
+        else:
+            name = " ".join(rng.choice(_FILLER_WORDS) for _ in range(rng.randint(1, 3)))
+            name = f"{rng.choice(['Blue', 'Joe', 'Sunset', 'Main St', 'Golden'])} {name}"
+        place_types = rng.sample(types, rng.randint(0, 3))
+        places.append((name, place_types))
+    return places
+
+
+def _stub_places_client(places: Sequence[Tuple[str, List[str]]]):
+    """PlacesClient whose HTTP transport answers from memory (no network)."""
+    import requests
+    from requests.adapters import BaseAdapter
+    from urllib.parse import parse_qs, urlparse
+
+    from places import PlacesCache, PlacesClient
+
+    lookup = {name: place_types for name, place_types in places}
+
+    class StubAdapter(BaseAdapter):
+        def send(self, request, **kwargs):
+            query = parse_qs(urlparse(request.url).query)
+            name = query.get("input", [""])[0]
+            candidates = []
+            if name in lookup:
+                candidates.append({
+                    "place_id": f"stub-{abs(hash(name))}",
+                    "name": name,
+                    "formatted_address": "1 Benchmark Way",
+                    "types": lookup[name],
+                })
+            response = requests.Response()
+            response.status_code = 200
+            status = "OK" if candidates else "ZERO_RESULTS"
+            response._content = json.dumps({"candidates": candidates, "status": status}).encode("utf-8")
+            response.headers["Content-Type"] = "application/json"
+            response.url = request.url
+            response.request = request
+            return response
+
+        def close(self):
+            pass
+
+    client = PlacesClient("benchmark-key", cache=PlacesCache(":memory:"), url="http://places.stub/json")
+    client.session.mount("http://", StubAdapter())
+    return client
+
+
+# -----------------------------------------------------------------------------
+# Measurement
+# -----------------------------------------------------------------------------
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(
+    stage: str,
+    scale: str,
+    fn: Callable[[int], object],
+    iterations: int,
+    setup: Optional[Callable[[], object]] = None,
+) -> Dict:
+    """
+    Times fn(i) for i in range(iterations), then re-runs a small sample under
+    tracemalloc for the peak allocation. setup, if given, runs before both
+    passes (e.g. to empty a cache so the sample sees the same state).
+    """
+    if setup is not None:
+        setup()
+    latencies = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    for i in range(min(iterations, MEMORY_SAMPLE)):
+        fn(i)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "stage": stage,
+        "scale": scale,
+        "iterations": iterations,
+        "throughput_per_s": round(iterations / elapsed, 1) if elapsed else None,
+        "p50_us": round(_percentile(latencies, 50) * 1e6, 2),
+        "p99_us": round(_percentile(latencies, 99) * 1e6, 2),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def _clear_fuzzy_cache() -> None:
+    """Empties the memoized fuzzy matcher so a mapping stage starts cold."""
+    cache_clear = getattr(map_to_category._FUZZY_MATCHER.match, "cache_clear", None)
+    if cache_clear is not None:
+        cache_clear()
+
+
+def _parse_scale(scale: str) -> Tuple[int, int]:
+    cards, _, columns = scale.lower().partition("x")
+    return int(cards), int(columns)
+
+
+def run_benchmarks(scales: Sequence[str], iterations: int, seed: int) -> Dict:
+    """Runs every stage; matrix-independent stages once, ranking stages per scale."""
+    import numpy as np
+
+    from map import get_best_cards_for_category
+    from result_cache import ResultCache
+    from rewards_matrix import RewardsMatrix, get_rewards_matrix
+
+    rng = random.Random(seed)
+    places = synthetic_places(max(iterations, 1), rng)
+    results = []
+
+    client = _stub_places_client(places)
+    results.append(measure("places_lookup_uncached", "-", lambda i: client.lookup(places[i][0]), iterations))
+    results.append(measure("places_lookup_cached", "-", lambda i: client.lookup(places[i][0]), iterations))
+    # The fuzzy fallback is memoized: time each mapper from an empty cache,
+    # then again with every name already cached
+    for stage, mapper in (
+        ("map_place_to_category", map_place_to_category),
+        ("map_place_to_categories", map_place_to_categories),
+    ):
+        results.append(measure(
+            f"{stage}_uncached", "-", lambda i, mapper=mapper: mapper(*places[i]), iterations,
+            setup=_clear_fuzzy_cache,
+        ))
+        results.append(measure(
+            f"{stage}_cached", "-", lambda i, mapper=mapper: mapper(*places[i]), iterations
+        ))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in scales:
+            n_cards, n_columns = _parse_scale(scale)
+            path = os.path.join(tmp, f"matrix_{n_cards}x{n_columns}.csv")
+            cards = write_synthetic_matrix(path, n_cards, n_columns, rng)
+            wallets = [rng.sample(cards, min(5, len(cards))) for _ in range(64)]
+            categories = [list(map_place_to_categories(*place)) for place in places]
+            categories = [[c for c in cats if c] for cats in categories]
+
+            results.append(measure("matrix_load_csv", scale, lambda i: RewardsMatrix(path), 3))
+            matrix = get_rewards_matrix(path)
+            results.append(measure(
+                "build_search_terms", scale,
+                lambda i: build_search_terms(categories[i][-1], matrix.columns), iterations,
+            ))
+
+            # Uncached ranking: disable the result cache so every call ranks
+            matrix.result_cache = ResultCache(max_entries=0)
+            results.append(measure(
+                "get_best_cards_for_category", scale,
+                lambda i: get_best_cards_for_category(
+                    categories[i][0], categories=categories[i],
+                    matrix_csv_path=path, card_whitelist=wallets[i % len(wallets)],
+                ),
+                iterations,
+            ))
+            matrix.result_cache = ResultCache()
+            results.append(measure(
+                "get_best_cards_for_category_cached", scale,
+                lambda i: get_best_cards_for_category(
+                    categories[i % 32][0], categories=categories[i % 32],
+                    matrix_csv_path=path, card_whitelist=wallets[i % 4],
+                ),
+                iterations,
+            ))
+            batch = [categories[i] for i in range(min(iterations, 256))]
+            results.append(measure(
+                "rank_batch_256x8", scale,
+                lambda i: matrix.rank_batch(batch, wallets[:8], top_n=3), max(1, iterations // 50),
+            ))
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "seed": seed,
+            "iterations": iterations,
+            "scales": list(scales),
+        },
+        "results": results,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the mapping and ranking hot paths.")
+    parser.add_argument("--scales", nargs="+", default=DEFAULT_SCALES, help="CARDSxCOLUMNS, e.g. 500x200")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("-o", "--output", help="Write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.scales, args.iterations, args.seed)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        for row in report["results"]:
+            print(f"{row['stage']:<38} {row['scale']:>10} p50 {row['p50_us']:>10.1f} us"
+                  f"  p99 {row['p99_us']:>10.1f} us  {row['throughput_per_s'] or 0:>10.1f}/s"
+                  f"  peak {row['peak_kib']:>8.1f} KiB", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
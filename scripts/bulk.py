@@ -0,0 +1,257 @@
+"""
+Streaming bulk recommendations.
+
+Reads a CSV or JSONL file of addresses (or transaction rows with a merchant
+name and amount) and runs every row through Places lookup ->
+categories_for_place -> ranking, writing one JSON line per input row.
+
+Rows are processed in fixed-size chunks by a chain of generators, so memory
+stays bounded regardless of input size while each chunk still gets a
+concurrent lookup and a single batched ranking pass. Output keeps input
+order and each line carries its input row number, so a crashed run can be
+resumed from the row after the last record written.
+"""
+
+import csv
+import itertools
+import json
+import os
+import sys
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from map import categories_for_place
+from rewards_matrix import get_rewards_matrix
+
+# Input columns tried, in order, for the text to look up
+TEXT_FIELDS = ("address", "merchant", "merchant_name", "name", "description")
+DEFAULT_CHUNK_SIZE = 256
+
+
+def _detect_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    return "jsonl" if ext in (".jsonl", ".ndjson", ".json") else "csv"
+
+
+def read_rows(stream: IO[str], fmt: str = "csv") -> Iterator[dict]:
+    """Yields input rows as dicts, one at a time."""
+    if fmt == "jsonl":
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    else:
+        yield from csv.DictReader(stream)
+
+
+def _row_text(row: dict) -> str:
+    for field in TEXT_FIELDS:
+        value = row.get(field)
+        if value:
+            return str(value).strip()
+    return ""
+
+
+def _row_types(row: dict) -> List[str]:
+    types = row.get("types") or []
+    if isinstance(types, str):
+        types = [t.strip() for t in types.replace("|", ";").split(";") if t.strip()]
+    return list(types)
+
+
+def _row_amount(row: dict) -> Optional[float]:
+    value = row.get("amount")
+    if value in (None, ""):
+        return None
+    try:
+        return float(str(value).replace(",", "").replace("$", ""))
+    except ValueError:
+        return None
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def new_record(index: int, text: str, amount: Optional[float] = None) -> Dict:
+    """An unfilled recommendation record for one input row (see recommend_rows)."""
+    return {
+        "row": index,
+        "input": text,
+        "amount": amount,
+        "place": None,
+        "categories": [],
+        "top_cards": [],
+        "estimated_rewards": None,
+        "error": None,
+    }
+
+
+def format_cards(results: Sequence[Tuple[str, float, str]]) -> List[Dict]:
+    """Ranking tuples (card, rate, offer) as top_cards dicts."""
+    return [{"card": card, "reward_rate": rate, "offer": offer} for card, rate, offer in results]
+
+
+def fill_ranking(record: Dict, results: Sequence[Tuple[str, float, str]]) -> None:
+    """Sets a record's top_cards and, if it has an amount, estimated_rewards at the best card's rate."""
+    record["top_cards"] = format_cards(results)
+    if record["amount"] is not None and results:
+        record["estimated_rewards"] = round(record["amount"] * results[0][1] / 100, 2)
+
+
+def recommend_rows(
+    rows: Iterable[dict],
+    card_whitelist: List[str],
+    client=None,
+    matrix_csv_path: str = "card_rewards_matrix.csv",
+    top_n: int = 3,
+    start: int = 0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    concurrency: int = 8,
+) -> Iterator[Dict]:
+    """
+    Yields one recommendation record per input row, in input order.
+
+    Args:
+        rows: Input row dicts (see TEXT_FIELDS; optional "amount" and "types")
+        card_whitelist: Cards to rank
+        client: PlacesClient used to resolve row text; without one the text is
+            treated as the place name and the row's own "types" are used
+        matrix_csv_path: Path to rewards matrix CSV
+        top_n: Number of cards per record
+        start: Input row number to resume from (earlier rows are skipped)
+        chunk_size: Rows looked up and ranked together
+        concurrency: Parallel lookups per chunk
+
+    Yields:
+        Dicts with row, input, amount, place, categories, top_cards,
+        estimated_rewards and error (set when the lookup failed)
+    """
+    numbered = itertools.islice(enumerate(rows), start, None)
+    for chunk in _chunks(numbered, chunk_size):
+        texts = [_row_text(row) for _, row in chunk]
+        if client is not None:
+            places = client.lookup_many(texts, concurrency=concurrency, return_exceptions=True)
+        else:
+            places = [
+                {"name": text, "types": _row_types(row)} if text else None
+                for text, (_, row) in zip(texts, chunk)
+            ]
+
+        records = []
+        category_sets = []
+        for (index, row), text, place in zip(chunk, texts, places):
+            record = new_record(index, text, _row_amount(row))
+            if isinstance(place, Exception):
+                record["error"] = str(place)
+            elif place is not None:
+                record["place"] = place
+                record["categories"] = categories_for_place(
+                    place.get("name", ""), place.get("types", [])
+                )
+                category_sets.append((len(records), record["categories"]))
+            records.append(record)
+
+        if category_sets:
+            matrix = get_rewards_matrix(matrix_csv_path)
+            ranked = matrix.rank_batch(
+                [cats for _, cats in category_sets], [card_whitelist], top_n=top_n
+            )
+            for (position, _), results in zip(category_sets, ranked):
+                fill_ranking(records[position], results[0])
+
+        yield from records
+
+
+def _complete_tail(path: str, block_size: int = 1 << 16):
+    """
+    Finds the end of the last complete (newline-terminated) line of a file.
+
+    Returns:
+        (byte offset just past that line, the line itself or None if there is none)
+    """
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        tail = b""
+        position = end
+        while position > 0:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+            last_newline = tail.rfind(b"\n")
+            if last_newline < 0:
+                continue
+            previous = tail.rfind(b"\n", 0, last_newline)
+            if previous >= 0 or position == 0:
+                return position + last_newline + 1, tail[previous + 1 : last_newline + 1]
+        return 0, None
+
+
+def resume_row(path: str) -> Optional[int]:
+    """
+    Input row after the last complete record in an output file, or None if
+    it has none. Uses the record's own "row", so runs that began at a
+    --start offset resume correctly.
+    """
+    if not os.path.exists(path):
+        return None
+    _, line = _complete_tail(path)
+    if line is None:
+        return None
+    return json.loads(line)["row"] + 1
+
+
+def run_bulk(
+    input_path: str,
+    output_path: Optional[str],
+    card_whitelist: List[str],
+    client=None,
+    fmt: Optional[str] = None,
+    resume: bool = False,
+    start: int = 0,
+    **kwargs,
+) -> int:
+    """
+    Streams input_path ("-" for stdin) to JSONL at output_path (None for stdout).
+
+    With resume=True the start row is the one after the last complete
+    record in output_path (or start, if the output is still empty), and new
+    records are appended to it.
+
+    Returns:
+        Number of records written
+    """
+    if resume and output_path and os.path.exists(output_path):
+        # Drop a partially written trailing line from a crashed run
+        data_end, _ = _complete_tail(output_path)
+        with open(output_path, "ab") as f:
+            f.truncate(data_end)
+        start = max(start, resume_row(output_path) or 0)
+    fmt = fmt or (_detect_format(input_path) if input_path != "-" else "csv")
+
+    in_stream = sys.stdin if input_path == "-" else open(input_path, newline="", encoding="utf-8")
+    out_stream = (
+        open(output_path, "a" if resume else "w", encoding="utf-8") if output_path else sys.stdout
+    )
+    written = 0
+    try:
+        records = recommend_rows(
+            read_rows(in_stream, fmt), card_whitelist, client=client, start=start, **kwargs
+        )
+        for record in records:
+            out_stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            written += 1
+            if written % DEFAULT_CHUNK_SIZE == 0:
+                out_stream.flush()
+        out_stream.flush()
+    finally:
+        if in_stream is not sys.stdin:
+            in_stream.close()
+        if out_stream is not sys.stdout:
+            out_stream.close()
+    return written
@@ -0,0 +1,88 @@
+"""
+Startup-time guard for the library modules.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter and
+fails if the cumulative import time exceeds a budget or if a heavy
+dependency (pandas, numpy, requests, dotenv) is pulled in at import time.
+
+Usage:
+    python check_import_time.py                 # checks map, default budget
+    python check_import_time.py --budget-ms 50 map map_to_category
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+DEFAULT_BUDGET_MS = 60.0
+DEFAULT_RUNS = 5
+HEAVY_MODULES = ("pandas", "numpy", "requests", "dotenv")
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure_import(module: str) -> Tuple[float, Dict[str, float]]:
+    """
+    Imports module in a fresh interpreter with -X importtime.
+
+    Returns:
+        (cumulative import time of module in ms,
+         top-level package -> cumulative ms for every package imported)
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SCRIPTS_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    packages: Dict[str, float] = {}
+    total = 0.0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if not cumulative.isdigit():
+            continue  # header row
+        ms = int(cumulative) / 1000.0
+        top = name.split(".")[0]
+        packages[top] = max(packages.get(top, 0.0), ms)
+        if name == module:
+            total = ms
+    return total, packages
+
+
+def check(modules: List[str], budget_ms: float, runs: int) -> List[str]:
+    """Returns a list of budget violations (empty when everything passes)."""
+    failures = []
+    for module in modules:
+        # Best of several runs filters out noise from a cold disk cache
+        samples = [measure_import(module) for _ in range(max(1, runs))]
+        total, packages = min(samples, key=lambda sample: sample[0])
+        heavy = [name for name in HEAVY_MODULES if name in packages]
+        status = "ok" if total <= budget_ms and not heavy else "FAIL"
+        print(f"{module}: {total:.1f} ms (budget {budget_ms:.0f} ms) {status}")
+        if total > budget_ms:
+            failures.append(f"{module} imports in {total:.1f} ms, over the {budget_ms:.0f} ms budget")
+        if heavy:
+            failures.append(f"{module} eagerly imports {', '.join(heavy)}")
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=["map"])
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    args = parser.parse_args(argv)
+
+    failures = check(args.modules, args.budget_ms, args.runs)
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
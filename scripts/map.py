@@ -7,23 +7,18 @@ This script:
 3. Maps the place to reward categories (e.g., "Target", "Restaurants", "Gas stations")
 4. Finds the best credit cards from the user's collection for that location
 5. Displays ranked results with reward rates and offer details
+
+Importing this module has no side effects: the CLI only runs through main(),
+and the heavy dependencies (numpy/pandas for the rewards matrix, requests for
+the Places client, python-dotenv) are imported on first use.
 """
 
 import os
-import re
 import sys
-import requests
-from dotenv import load_dotenv
-from map_to_category import (
-    map_place_to_categories,
-    build_search_terms,
-    FALLBACK_KEYWORDS,
-)
-import pandas as pd
+import metrics
+from map_to_category import map_place_to_categories
 from typing import List, Optional, Tuple
 
-load_dotenv()
-
 # -----------------------------------------------------------------------------
 # Configuration: User's credit card collection
 # -----------------------------------------------------------------------------
@@ -37,75 +32,17 @@ USER_CARDS: List[str] = [
 
 
 # -----------------------------------------------------------------------------
-# Helper Functions
+# Ranking
 # -----------------------------------------------------------------------------
 
-def _generate_offer_text(
-    card_row: pd.Series, search_terms: List[str], all_columns: List[str]
-) -> str:
+@metrics.timed("map_place")
+def categories_for_place(place_name: str, types: Optional[List[str]]) -> List[str]:
     """
-    Generates reward offer text for a card from the rewards matrix data.
-    
-    Args:
-        card_row: Pandas Series representing one row from the rewards matrix
-        search_terms: List of category terms to prioritize
-        all_columns: List of all category columns in the dataframe
-        
-    Returns:
-        Formatted offer text like "4% — Restaurants | 1% — Everywhere"
+    Reward categories to rank a place by: the brand category (if any)
+    followed by the type/fuzzy default category.
     """
-    # Extract all non-zero reward categories from the card
-    offers = []
-    for col in all_columns:
-        if col == "Card Name":
-            continue
-        value = card_row.get(col, 0.0)
-        
-        # Convert to numeric if needed
-        if isinstance(value, str):
-            cleaned = str(value).replace(",", "").strip()
-            match = re.search(r"(-?\d+(?:\.\d+)?)", cleaned)
-            if match:
-                value = float(match.group(1))
-            else:
-                value = 0.0
-        else:
-            value = float(value) if pd.notna(value) else 0.0
-        
-        if value > 0:
-            offers.append((col, value))
-    
-    if not offers:
-        return ""
-    
-    # Only show categories that match search terms
-    # Exclude all other unrelated categories (including fallback categories)
-    lowered_terms = [term.lower() for term in search_terms]
-    matched_offers = []
-    
-    for category, rate in offers:
-        category_lower = category.lower()
-        # Only include categories that match search terms
-        if any(term in category_lower for term in lowered_terms):
-            matched_offers.append((category, rate))
-        # Otherwise, exclude this category (don't show unrelated offers)
-    
-    # Sort by reward rate (highest first)
-    matched_offers.sort(key=lambda x: x[1], reverse=True)
-    
-    # Only show matched offers (the actual category being searched)
-    display_offers = matched_offers
-    
-    # Format as "X% — Category Name" (remove trailing zeros for whole numbers)
-    formatted = []
-    for category, rate in display_offers:
-        # Format rate: remove trailing zeros if it's a whole number
-        if rate == int(rate):
-            rate_str = str(int(rate))
-        else:
-            rate_str = str(rate).rstrip("0").rstrip(".")
-        formatted.append(f"{rate_str}% — {category}")
-    return " | ".join(formatted)
+    brand_cat, default_cat = map_place_to_categories(place_name or "", types or [])
+    return [c for c in [brand_cat, default_cat] if c] or ["Other purchases"]
 
 
 def get_best_cards_for_category(
@@ -119,7 +56,7 @@ def get_best_cards_for_category(
     Finds the best credit cards for a given reward category.
     
     This function:
-    1. Loads the rewards matrix CSV
+    1. Gets the cached rewards matrix (loaded once, reloaded if the CSV changes)
     2. Filters to user's cards (or provided whitelist)
     3. Finds reward columns matching the category
     4. Scores each card by maximum reward rate
@@ -135,183 +72,202 @@ def get_best_cards_for_category(
     Returns:
         List of tuples: (card_name, reward_rate, offer_text), sorted by reward rate descending
     """
-    # Load rewards matrix
-    df = pd.read_csv(matrix_csv_path)
-    
-    if "Card Name" not in df.columns:
-        raise ValueError("Matrix CSV must have a 'Card Name' column.")
+    from rewards_matrix import get_rewards_matrix
+
+    matrix = get_rewards_matrix(matrix_csv_path)
     
     # Filter to user's cards (or provided whitelist)
     whitelist = card_whitelist if card_whitelist is not None else USER_CARDS
     
-    if whitelist:
-        whitelist_lower = {name.lower() for name in whitelist}
-        df = df[df["Card Name"].str.lower().isin(whitelist_lower)].reset_index(drop=True)
-        
-        # Add missing cards with zero rewards (so all user cards appear in results)
-        existing_lower = set(df["Card Name"].str.lower())
-        zero_template = {col: 0.0 for col in df.columns if col != "Card Name"}
-        missing_rows = []
-        for card_name in whitelist:
-            if card_name.lower() in existing_lower:
-                continue
-            missing_rows.append({"Card Name": card_name, **zero_template})
-        if missing_rows:
-            df = pd.concat([df, pd.DataFrame(missing_rows)], ignore_index=True)
-    
-    if df.empty:
-        return []
-    
-    # Build search terms from category/categories
-    # If multiple categories provided, combine their search terms
-    if categories:
-        terms: List[str] = []
-        for cat in categories:
-            terms.extend(build_search_terms(cat, list(df.columns)))
-        # Deduplicate while preserving order
-        seen = set()
-        search_terms = []
-        for t in terms:
-            tl = t.lower()
-            if tl in seen:
-                continue
-            seen.add(tl)
-            search_terms.append(t)
-    else:
-        search_terms = build_search_terms(category, list(df.columns))
-    
-    # Find reward columns that match the search terms
-    candidate_columns = [
-        column
-        for column in df.columns
-        if column != "Card Name" and any(term.lower() in column.lower() for term in search_terms)
-    ]
-    
-    # Fallback to generic "everywhere" columns if no specific match
-    if not candidate_columns:
-        candidate_columns = [
-            column
-            for column in df.columns
-            if column != "Card Name"
-            and any(keyword in column.lower() for keyword in FALLBACK_KEYWORDS)
-        ]
-    
-    if not candidate_columns:
-        return []
-    
-    # Convert reward values to numeric and aggregate
-    # For each card, take the maximum reward rate across matching columns
-    numeric_columns: dict[str, pd.Series] = {}
-    for column in candidate_columns:
-        cleaned_series = (
-            df[column]
-            .astype(str)
-            .str.replace(",", "", regex=False)
-            .str.extract(r"(-?\d+(?:\.\d+)?)", expand=False)
-        )
-        numeric_columns[column] = pd.to_numeric(cleaned_series, errors="coerce")
-    
-    numeric_df = pd.DataFrame(numeric_columns).fillna(0.0)
-    aggregated_series = numeric_df.max(axis=1)
-    
-    if aggregated_series.empty:
-        return []
+    # Resolve matching reward columns from the precomputed category index
+    # If multiple categories provided, their columns are considered together
+    return matrix.rank_categories(
+        categories or [category], card_whitelist=whitelist, top_n=top_n
+    )
+
+
+def get_best_cards_batch(
+    category_sets: List[List[str]],
+    card_whitelists: Optional[List[Optional[List[str]]]] = None,
+    top_n: int = 20,
+    matrix_csv_path: str = "card_rewards_matrix.csv",
+) -> List[List[List[Tuple[str, float, str]]]]:
+    """
+    Batch version of get_best_cards_for_category for many places and wallets.
     
-    # Sort cards by reward rate (highest first)
-    scores_df = pd.DataFrame({
-        "Card Name": df["Card Name"],
-        "score": aggregated_series,
-    }).sort_values("score", ascending=False, kind="mergesort")
+    Every (category set, whitelist) pair is scored in one vectorized pass
+    over the rewards matrix instead of one ranking call per pair.
     
-    # Build results with card name, reward rate, and offer text
-    # Generate offer text directly from the matrix data
-    all_columns = [col for col in df.columns if col != "Card Name"]
-    results: List[Tuple[str, float, str]] = []
-    for _, score_row in scores_df.head(top_n).iterrows():
-        card_name = score_row["Card Name"]
-        reward_value = float(score_row["score"]) if pd.notna(score_row["score"]) else 0.0
-        
-        # Only generate offer text if there's a match (reward_value > 0)
-        # Otherwise, show empty offer text
-        if reward_value > 0:
-            # Get the full card row from the original dataframe
-            card_row = df[df["Card Name"] == card_name].iloc[0]
-            # Generate offer text from the matrix data (only relevant categories)
-            offer_text = _generate_offer_text(card_row, search_terms, all_columns)
-        else:
-            offer_text = ""
+    Args:
+        category_sets: N category lists (e.g. the categories mapped for each place)
+        card_whitelists: M card lists (None entries use USER_CARDS; defaults to [USER_CARDS])
+        top_n: Number of top cards to return per pair
+        matrix_csv_path: Path to rewards matrix CSV
         
-        results.append((card_name, reward_value, offer_text))
-    
-    return results
+    Returns:
+        results[n][m]: the get_best_cards_for_category result for
+        category_sets[n] and card_whitelists[m]
+    """
+    from rewards_matrix import get_rewards_matrix
+
+    matrix = get_rewards_matrix(matrix_csv_path)
+    whitelists = card_whitelists if card_whitelists is not None else [None]
+    whitelists = [wl if wl is not None else USER_CARDS for wl in whitelists]
+    return matrix.rank_batch(category_sets, whitelists, top_n=top_n)
 
 
 # -----------------------------------------------------------------------------
 # Main Script: Google Places API lookup and card recommendation
 # -----------------------------------------------------------------------------
 
-# Validate API key
-API_KEY = os.environ.get("GOOGLE_PLACES_API_KEY")
-if not API_KEY:
-    print("Set GOOGLE_PLACES_API_KEY first.")
-    sys.exit(1)
-
-# Validate command line arguments
-if len(sys.argv) < 2:
-    print("Usage: python map.py '1600 Amphitheatre Pkwy, Mountain View, CA'")
-    sys.exit(1)
-
-# Get address from command line arguments
-address = " ".join(sys.argv[1:])
-
-# Look up place using Google Places API
-url = "https://maps.googleapis.com/maps/api/place/findplacefromtext/json"
-params = {
-    "input": address,
-    "inputtype": "textquery",
-    "fields": "place_id,name,formatted_address,types",
-    "key": API_KEY,
-}
-
-resp = requests.get(url, params=params, timeout=10)
-resp.raise_for_status()
-data = resp.json()
-
-# Extract place information
-cands = data.get("candidates", [])
-if not cands:
-    print("No place found.")
-    sys.exit(0)
-
-place = cands[0]  # Use the best match
-
-# Display place information
-print("Name:", place.get("name"))
-print("Address:", place.get("formatted_address"))
-print("Place ID:", place.get("place_id"))
-print("Types:", place.get("types", []))
-
-# Map place to reward categories (both brand-specific and default)
-brand_cat, default_cat = map_place_to_categories(
-    place.get("name", ""), place.get("types", [])
-)
-categories_used = [c for c in [brand_cat, default_cat] if c]
-category = brand_cat or default_cat or "Other purchases"
-
-print("Mapped Category:", category)
-if len(categories_used) > 1:
-    print("Also considering categories:", ", ".join(categories_used[1:]))
-
-# Find best cards for this location
-top_cards = get_best_cards_for_category(
-    category, categories=categories_used or None
-)
-
-# Display results
-if not top_cards:
-    print("No rewards data found for this category.")
-else:
-    print("Top cards for category:")
-    for rank, (card, reward_value, offer_text) in enumerate(top_cards, start=1):
-        display_offer = f" — {offer_text}" if offer_text else ""
-        print(f"  {rank}. {card}: {reward_value}{display_offer}")
+def _bulk_main(argv: List[str]) -> int:
+    """Bulk mode: python map.py --bulk transactions.csv [-o results.jsonl] [--resume]"""
+    import argparse
+    from bulk import run_bulk
+    from places import PlacesCache, PlacesClient
+
+    parser = argparse.ArgumentParser(
+        prog="map.py --bulk",
+        description="Stream a CSV/JSONL of addresses or transactions to JSONL recommendations.",
+    )
+    parser.add_argument("input", help="Input file, or - for stdin")
+    parser.add_argument("-o", "--output", help="Output JSONL file (default: stdout)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Input format (default: from extension)")
+    parser.add_argument("--resume", action="store_true", help="Continue after the records already in --output")
+    parser.add_argument("--start", type=int, default=0, help="Input row number to start from")
+    parser.add_argument("--offline", action="store_true", help="Map row text directly, without Places lookups")
+    parser.add_argument("--top-n", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--matrix", default="card_rewards_matrix.csv", help="Rewards matrix CSV")
+    args = parser.parse_args(argv)
+
+    client = None
+    if not args.offline:
+        api_key = os.environ.get("GOOGLE_PLACES_API_KEY")
+        if not api_key:
+            print("Set GOOGLE_PLACES_API_KEY first (or pass --offline).")
+            return 1
+        client = PlacesClient(api_key, cache=PlacesCache())
+
+    run_bulk(
+        args.input,
+        args.output,
+        USER_CARDS,
+        client=client,
+        fmt=args.format,
+        resume=args.resume,
+        start=args.start,
+        matrix_csv_path=args.matrix,
+        top_n=args.top_n,
+        concurrency=args.concurrency,
+    )
+    return 0
+
+
+def _capture_options(argv: List[str]) -> Tuple[List[str], bool, Optional[str], bool]:
+    """Splits --metrics, --profile PATH and --trace-memory off the arguments."""
+    rest: List[str] = []
+    emit_metrics, profile_path, trace_memory = False, None, False
+    args = iter(argv)
+    for arg in args:
+        if arg == "--metrics":
+            emit_metrics = True
+        elif arg == "--trace-memory":
+            trace_memory = True
+        elif arg == "--profile":
+            profile_path = next(args, "map.prof")
+        elif arg.startswith("--profile="):
+            profile_path = arg.split("=", 1)[1]
+        else:
+            rest.append(arg)
+    return rest, emit_metrics, profile_path, trace_memory
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command-line entry point.
+
+    --metrics logs stage timings and counters as a JSON line on stderr,
+    --profile PATH dumps cProfile stats for the run and --trace-memory
+    prints its peak and top allocation sites.
+
+    Args:
+        argv: Arguments without the program name (defaults to sys.argv[1:])
+
+    Returns:
+        Process exit code
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    argv = sys.argv[1:] if argv is None else argv
+    argv, emit_metrics, profile_path, trace_memory = _capture_options(argv)
+    if emit_metrics:
+        metrics.enable()
+
+    with metrics.capture(profile_path, trace_memory):
+        if argv and argv[0] == "--bulk":
+            code = _bulk_main(argv[1:])
+        else:
+            code = _lookup_main(argv)
+    if emit_metrics:
+        metrics.log_snapshot()
+    return code
+
+
+def _lookup_main(argv: List[str]) -> int:
+    """Single lookup: python map.py '<address or place name>'"""
+    # Validate API key
+    api_key = os.environ.get("GOOGLE_PLACES_API_KEY")
+    if not api_key:
+        print("Set GOOGLE_PLACES_API_KEY first.")
+        return 1
+
+    # Validate command line arguments
+    if not argv:
+        print("Usage: python map.py '1600 Amphitheatre Pkwy, Mountain View, CA'")
+        print("       python map.py --bulk transactions.csv -o results.jsonl")
+        print("       [--metrics] [--profile map.prof] [--trace-memory]")
+        return 1
+
+    # Get address from command line arguments
+    address = " ".join(argv)
+
+    # Look up place using Google Places API (repeat lookups come from the local cache)
+    from places import PlacesCache, PlacesClient
+
+    place = PlacesClient(api_key, cache=PlacesCache()).lookup(address)
+    if place is None:
+        print("No place found.")
+        return 0
+
+    # Display place information
+    print("Name:", place.get("name"))
+    print("Address:", place.get("formatted_address"))
+    print("Place ID:", place.get("place_id"))
+    print("Types:", place.get("types", []))
+
+    # Map place to reward categories (both brand-specific and default)
+    categories_used = categories_for_place(place.get("name", ""), place.get("types", []))
+    category = categories_used[0]
+
+    print("Mapped Category:", category)
+    if len(categories_used) > 1:
+        print("Also considering categories:", ", ".join(categories_used[1:]))
+
+    # Find best cards for this location
+    top_cards = get_best_cards_for_category(category, categories=categories_used)
+
+    # Display results
+    if not top_cards:
+        print("No rewards data found for this category.")
+    else:
+        print("Top cards for category:")
+        for rank, (card, reward_value, offer_text) in enumerate(top_cards, start=1):
+            display_offer = f" — {offer_text}" if offer_text else ""
+            print(f"  {rank}. {card}: {reward_value}{display_offer}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
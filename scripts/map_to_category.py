@@ -1,5 +1,9 @@
 import re
-from difflib import get_close_matches
+from collections import Counter
+from difflib import SequenceMatcher, get_close_matches
+from functools import lru_cache
+
+import metrics
 
 # -------------------------------------------------------------------
 # 1. Category master list (from your dataset)
@@ -91,6 +95,79 @@ def _normalize_text(s: str) -> str:
 
 _NORMALIZED_BRAND_OVERRIDES = { _normalize_text(k): v for k, v in BRAND_OVERRIDES.items() }
 
+
+class _BrandMatcher:
+    """
+    Aho-Corasick automaton over normalized brand names.
+
+    Finds every brand contained in a normalized place name in one pass, so
+    lookup cost does not grow with the size of the override table.
+    Conflicts resolve deterministically: the longest brand wins, and among
+    equally long brands the one occurring first in the name.
+    """
+
+    def __init__(self, patterns: dict[str, str]):
+        # Node i: outgoing edges, failure link, longest brand ending here
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._best: list[tuple[int, str] | None] = [None]
+        for pattern, category in patterns.items():
+            if pattern:
+                self._add(pattern, category)
+        self._link()
+
+    def _add(self, pattern: str, category: str) -> None:
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._best.append(None)
+            node = nxt
+        self._best[node] = (len(pattern), category)
+
+    def _link(self) -> None:
+        # Breadth-first so failure targets are finished before their dependents
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                # A terminal node's own brand is always longer than its suffixes'
+                if self._best[child] is None:
+                    self._best[child] = self._best[self._fail[child]]
+                queue.append(child)
+
+    def match(self, text: str) -> str | None:
+        """Returns the category of the best brand found in normalized text."""
+        best: tuple[int, str] | None = None
+        node = 0
+        for ch in text:
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            found = self._best[node]
+            if found is not None and (best is None or found[0] > best[0]):
+                best = found
+        return best[1] if best else None
+
+
+_BRAND_MATCHER = _BrandMatcher(_NORMALIZED_BRAND_OVERRIDES)
+
+
+def _match_brand(place_name: str) -> str | None:
+    """Category for the brand contained in place_name, if any."""
+    return _BRAND_MATCHER.match(_normalize_text(place_name or ""))
+
 # -------------------------------------------------------------------
 # 3. Google place type → Category mappings
 # -------------------------------------------------------------------
@@ -134,6 +211,101 @@ TYPE_TO_CATEGORY = {
     "spa": "Beauty",
 }
 
+# -------------------------------------------------------------------
+# Fuzzy category matching (fallback when no brand/type mapping hits)
+# -------------------------------------------------------------------
+FUZZY_CUTOFF = 0.6
+
+
+class DifflibMatcher:
+    """
+    Reference backend: difflib.get_close_matches(query, choices, n=1, cutoff).
+    Scores every choice with SequenceMatcher on every call.
+    """
+
+    def __init__(self, choices: list[str], cutoff: float = FUZZY_CUTOFF):
+        self.choices = list(choices)
+        self.cutoff = cutoff
+
+    def match(self, query: str) -> str | None:
+        matches = get_close_matches(query, self.choices, n=1, cutoff=self.cutoff)
+        return matches[0] if matches else None
+
+
+class IndexedFuzzyMatcher:
+    """
+    Same top-1-with-cutoff result as DifflibMatcher, computed against a
+    precomputed index of the choices.
+
+    SequenceMatcher.ratio() never exceeds the character-multiset bound
+    (difflib's quick_ratio). A character -> choices postings index built once
+    gives that bound for every choice in a single pass over the query's
+    characters; choices are then scored in bound order and the exact ratio is
+    only computed while a choice can still beat the best one found. Results
+    for repeated queries are memoized.
+    """
+
+    def __init__(
+        self, choices: list[str], cutoff: float = FUZZY_CUTOFF, cache_size: int = 4096
+    ):
+        self.choices = list(dict.fromkeys(choices))
+        self.cutoff = cutoff
+        self._lengths = [len(c) for c in self.choices]
+        # Character -> [(choice index, occurrences)] for the multiset bound
+        self._postings: dict[str, list[tuple[int, int]]] = {}
+        for i, choice in enumerate(self.choices):
+            for ch, n in Counter(choice).items():
+                self._postings.setdefault(ch, []).append((i, n))
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+
+    def _match(self, query: str) -> str | None:
+        la = len(query)
+        common = [0] * len(self.choices)
+        for ch, n in Counter(query).items():
+            for i, count in self._postings.get(ch, ()):
+                common[i] += n if n < count else count
+        bounded = []
+        for i, choice in enumerate(self.choices):
+            lb = self._lengths[i]
+            total = la + lb
+            if not total:
+                bounded.append((1.0, choice))
+                continue
+            bound = 2.0 * common[i] / total
+            if bound >= self.cutoff:
+                bounded.append((bound, choice))
+        # Highest bound first; get_close_matches breaks score ties by the larger string
+        bounded.sort(reverse=True)
+
+        best: tuple[float, str] | None = None
+        matcher = SequenceMatcher()
+        matcher.set_seq2(query)
+        for bound, choice in bounded:
+            if best is not None and bound < best[0]:
+                break
+            matcher.set_seq1(choice)
+            score = matcher.ratio()
+            if score >= self.cutoff and (best is None or (score, choice) > best):
+                best = (score, choice)
+        return best[1] if best else None
+
+
+_FUZZY_MATCHER = IndexedFuzzyMatcher(CATEGORIES)
+
+
+def set_fuzzy_matcher(matcher) -> None:
+    """
+    Swaps the fuzzy fallback backend. Any object with a
+    match(query) -> category-or-None method works.
+    """
+    global _FUZZY_MATCHER
+    _FUZZY_MATCHER = matcher
+
+
+def _fuzzy_category(place_name: str) -> str | None:
+    return _FUZZY_MATCHER.match(place_name or "")
+
+
 # -------------------------------------------------------------------
 # 4. Core mapping function
 # -------------------------------------------------------------------
@@ -145,18 +317,11 @@ def map_place_to_category(place_name: str, types: list[str]) -> str:
     if not place_name and not types:
         return "Other purchases"
 
-    name_lower = (place_name or "").lower()
-    name_norm = _normalize_text(place_name or "")
-
     # 1. Check brand overrides (e.g., Target, Whole Foods)
-    # First try normalized containment to absorb punctuation/spacing variants
-    for brand_norm, cat in _NORMALIZED_BRAND_OVERRIDES.items():
-        if brand_norm and brand_norm in name_norm:
-            return cat
-    # Fallback to legacy lowercase substring (covers simple cases)
-    for brand_raw, cat in BRAND_OVERRIDES.items():
-        if brand_raw in name_lower:
-            return cat
+    # Normalized containment absorbs punctuation/spacing variants
+    brand_category = _match_brand(place_name)
+    if brand_category is not None:
+        return brand_category
 
     # 2. Check explicit type mappings
     for t in types or []:
@@ -164,9 +329,9 @@ def map_place_to_category(place_name: str, types: list[str]) -> str:
             return TYPE_TO_CATEGORY[t]
 
     # 3. Fuzzy match name to category list (fallback)
-    matches = get_close_matches(place_name, CATEGORIES, n=1, cutoff=0.6)
-    if matches:
-        return matches[0]
+    match = _fuzzy_category(place_name)
+    if match:
+        return match
 
     # 4. Default fallback
     return "Other purchases"
@@ -180,31 +345,23 @@ def map_place_to_categories(place_name: str, types: list[str]) -> tuple[str | No
     - brand_category_or_None: category matched via BRAND_OVERRIDES (robust normalization)
     - default_category: category from types/fuzzy/default path (ignores brand overrides)
     """
-    name_lower = (place_name or "").lower()
-    name_norm = _normalize_text(place_name or "")
-
     # Brand category (robust normalization)
-    brand_category = None
-    for brand_norm, cat in _NORMALIZED_BRAND_OVERRIDES.items():
-        if brand_norm and brand_norm in name_norm:
-            brand_category = cat
-            break
-    if brand_category is None:
-        for brand_raw, cat in BRAND_OVERRIDES.items():
-            if brand_raw in name_lower:
-                brand_category = cat
-                break
+    brand_category = _match_brand(place_name)
+    if metrics.ENABLED:
+        metrics.incr("map_calls")
+        if brand_category is not None:
+            metrics.incr("map_brand")
 
     # Default path (ignore brand overrides; use types then fuzzy then fallback)
     if types:
         for t in types:
             if t in TYPE_TO_CATEGORY:
+                metrics.incr("map_type")
                 return (brand_category, TYPE_TO_CATEGORY[t])
-    matches = get_close_matches(place_name or "", CATEGORIES, n=1, cutoff=0.6)
-    if matches:
-        default_category = matches[0]
-    else:
-        default_category = "Other purchases"
+    metrics.incr("map_fuzzy")
+    default_category = _fuzzy_category(place_name) or "Other purchases"
+    if default_category == "Other purchases":
+        metrics.incr("map_other")
 
     return (brand_category, default_category)
 
@@ -257,5 +414,6 @@ if __name__ == "__main__":
         ("Some random gift shop", ["store"]),
         ("Marriott Marquis", ["lodging"]),
     ]
-
+    for name, types in examples:
+        print(f"{name!r} -> {map_place_to_categories(name, types)}")
 
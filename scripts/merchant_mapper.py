@@ -0,0 +1,207 @@
+"""
+Deduplicating bulk mapper for transaction merchant descriptors.
+
+Card statements repeat a small set of merchants across millions of rows,
+with per-store noise: "SQ *BLUE BOTTLE 0142", "STARBUCKS #1234", "SHELL OIL
+57442145". Descriptors are cleaned (processor prefixes, store numbers and
+reference codes stripped) into a merchant key, each distinct (key, types)
+pair is run through map_place_to_categories once, and the result is
+broadcast back to every row. Mapped keys are memoized across calls, so
+recurring merchants never re-enter the brand/type/fuzzy pipeline.
+
+Usage:
+    python merchant_mapper.py transactions.csv -o mapped.csv [--column merchant] [--types-column types]
+"""
+
+import argparse
+import csv
+import itertools
+import re
+import string
+import sys
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from map_to_category import map_place_to_categories
+from result_cache import ResultCache
+
+DEFAULT_CACHE_ENTRIES = 200_000
+# Rows read, mapped and written per map_many call by main()
+DEFAULT_CHUNK_ROWS = 10_000
+
+# Payment processor / aggregator prefixes ("SQ *", "TST* ", "PAYPAL *") and
+# the wording banks put before the merchant on debit rows
+_PROCESSOR_PREFIX_RE = re.compile(
+    r"^(?:(?:sq|squ|tst|pp|paypal|sp|ic|dd|fs|par|bt|wpy|spr|lv|ec|pos|cke|ckc)\s?\*\s*"
+    r"|(?:pos(?:\s+(?:debit|purchase))?|debit\s+card\s+purchase|checkcard(?:\s+\d{4})?"
+    r"|purchase\s+authorized\s+on\s+\d{1,2}/\d{1,2}|recurring\s+payment)\s+)",
+    re.IGNORECASE,
+)
+# Store numbers ("#1234", "STORE 0042", "NO. 17", "T-1234") and bare numeric tokens of 3+ digits
+_STORE_NUMBER_RE = re.compile(
+    r"(?:#\s*\d+|\b(?:store|str|no\.?|unit)\s*#?\s*\d+|\b[a-z]{1,2}-\d{2,}\b|\b\d{3,}\b)", re.IGNORECASE
+)
+# Trailing reference codes after a "*" ("AMZN MKTP US*2K4LT0Q41")
+_REFERENCE_RE = re.compile(r"\*\s*[a-z0-9]*\d[a-z0-9]*\s*$", re.IGNORECASE)
+_SEPARATORS_RE = re.compile(r"[\s*_]+")
+
+TypesLike = Union[None, str, Sequence[str]]
+
+
+def clean_merchant(descriptor: str) -> str:
+    """Strips processor prefixes, store numbers and reference codes; collapses whitespace."""
+    text = (descriptor or "").strip()
+    previous = None
+    while text != previous:  # prefixes can stack ("POS DEBIT SQ *...")
+        previous = text
+        text = _PROCESSOR_PREFIX_RE.sub("", text).strip()
+    text = _REFERENCE_RE.sub("", text)
+    text = _STORE_NUMBER_RE.sub(" ", text)
+    return _SEPARATORS_RE.sub(" ", text).strip(" -")
+
+
+def merchant_key(descriptor: str) -> str:
+    """Dedup key of a descriptor: the cleaned text, lowercased."""
+    return clean_merchant(descriptor).lower()
+
+
+def _types_key(types: TypesLike) -> Tuple[str, ...]:
+    if not types:
+        return ()
+    if isinstance(types, str):
+        types = types.replace("|", ";").split(";")
+    return tuple(t.strip() for t in types if t and t.strip())
+
+
+class MerchantMapper:
+    """
+    Maps merchant descriptors to (brand_category_or_None, default_category)
+    with per-key memoization.
+
+    The mapped name is rebuilt from the key (string.capwords), so every
+    descriptor sharing a key maps identically whatever its original casing;
+    this also lets the case-sensitive fuzzy fallback see "Grocery" rather
+    than the all-caps "GROCERY" statements use.
+
+    Args:
+        max_entries: Memoized (key, types) mappings kept across calls
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_ENTRIES):
+        self.cache = ResultCache(max_entries=max_entries)
+        self.rows = 0
+        self.unique_keys = 0
+
+    def map_key(self, key: str, types: Tuple[str, ...] = ()) -> Tuple[Optional[str], str]:
+        cache_key = (key, types)
+        mapped = self.cache.get(cache_key)
+        if mapped is None:
+            mapped = map_place_to_categories(string.capwords(key), list(types))
+            self.cache.put(cache_key, mapped)
+        return mapped
+
+    def map_many(
+        self,
+        descriptors: Iterable[str],
+        types: Optional[Iterable[TypesLike]] = None,
+    ) -> List[Tuple[Optional[str], str]]:
+        """
+        Maps every descriptor, running the mapping pipeline once per
+        distinct merchant.
+
+        Args:
+            descriptors: Merchant strings, one per row
+            types: Optional per-row Google types (lists, or ";"/"|"-separated
+                strings), aligned with descriptors
+
+        Returns:
+            One (brand_category_or_None, default_category) per row
+        """
+        descriptors = list(descriptors)
+        row_types = list(types) if types is not None else [None] * len(descriptors)
+        if len(row_types) != len(descriptors):
+            raise ValueError("types must have one entry per descriptor")
+
+        # Raw duplicates are the common case, so clean each raw string once
+        raw_slots: Dict[Tuple[str, object], int] = {}
+        row_slots = [
+            raw_slots.setdefault(
+                (descriptor or "", t if t is None or isinstance(t, str) else tuple(t)), len(raw_slots)
+            )
+            for descriptor, t in zip(descriptors, row_types)
+        ]
+        key_results: Dict[Tuple[str, Tuple[str, ...]], Tuple[Optional[str], str]] = {}
+        slot_results = []
+        for descriptor, t in raw_slots:
+            key = (merchant_key(descriptor), _types_key(t))
+            mapped = key_results.get(key)
+            if mapped is None:
+                mapped = key_results[key] = self.map_key(*key)
+            slot_results.append(mapped)
+
+        self.rows += len(descriptors)
+        self.unique_keys += len(key_results)
+        return [slot_results[slot] for slot in row_slots]
+
+    def categories_many(
+        self,
+        descriptors: Iterable[str],
+        types: Optional[Iterable[TypesLike]] = None,
+    ) -> List[List[str]]:
+        """map_many in the categories_for_place shape: [brand, default] without Nones."""
+        return [
+            [c for c in pair if c] or ["Other purchases"]
+            for pair in self.map_many(descriptors, types)
+        ]
+
+    def stats(self) -> Dict[str, float]:
+        return {"rows": self.rows, "unique_keys": self.unique_keys, "cache": self.cache.stats()}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Map transaction merchant strings to reward categories.")
+    parser.add_argument("input", help="Transactions CSV")
+    parser.add_argument("-o", "--output", help="Output CSV (default: stdout)")
+    parser.add_argument("--column", default="merchant", help="Merchant descriptor column")
+    parser.add_argument("--types-column", help="Optional column of ';'-separated Google types")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows mapped per batch")
+    args = parser.parse_args(argv)
+    if args.chunk_rows < 1:
+        parser.error("--chunk-rows must be at least 1")
+
+    mapper = MerchantMapper()
+    with open(args.input, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        fieldnames = list(reader.fieldnames or [])
+        if args.column not in fieldnames:
+            print(f"Column {args.column!r} not found in {args.input}", file=sys.stderr)
+            return 1
+        out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+        try:
+            writer = csv.DictWriter(out, fieldnames=fieldnames + ["merchant_key", "brand_category", "category"])
+            writer.writeheader()
+            # The mapper's cache persists across chunks, so each merchant is still mapped once
+            while True:
+                chunk = list(itertools.islice(reader, args.chunk_rows))
+                if not chunk:
+                    break
+                types = [row.get(args.types_column) for row in chunk] if args.types_column else None
+                mapped = mapper.map_many([row[args.column] for row in chunk], types)
+                keys: Dict[str, str] = {}
+                for row, (brand, default) in zip(chunk, mapped):
+                    descriptor = row[args.column]
+                    key = keys.get(descriptor)
+                    if key is None:
+                        key = keys[descriptor] = merchant_key(descriptor)
+                    row.update(merchant_key=key, brand_category=brand or "", category=default)
+                    writer.writerow(row)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    stats = mapper.stats()
+    # unique_keys counts per map_many call; cache misses are the merchants actually mapped
+    print(f"Mapped {stats['rows']} rows via {stats['cache']['misses']} distinct merchants", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""
+Opt-in instrumentation for the recommendation pipeline.
+
+Stage timers and counters are recorded only while metrics are enabled
+(enable(), or CARDGENIUS_METRICS=1 in the environment); when disabled every
+hook is a single flag check. Collected values can be exported as one JSON
+log line (log_snapshot) or in the Prometheus text format (render_prometheus,
+served by server.py at /metrics).
+
+Instrumented stages: places_lookup, map_place, matrix_load, rank, rank_batch.
+
+Counters:
+    places_cache_hits / places_cache_misses   Places lookups served locally / over HTTP
+    map_calls / map_brand / map_type / map_fuzzy / map_other
+                                              how each default category was resolved
+    rank_calls / rank_cache_hits              rank()/rank_categories() calls / memoized answers
+    rank_batch_pairs                          (category set, wallet) pairs ranked by rank_batch()
+    rank_everywhere_fallback                  computed rankings that only matched fallback columns
+    rank_candidate_columns                    candidate columns summed over computed rankings
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, IO, Iterator, List, Optional, Tuple
+
+# Upper bounds (seconds) of the Prometheus histogram buckets
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0,
+)
+METRIC_PREFIX = "cardgenius"
+
+ENABLED = os.environ.get("CARDGENIUS_METRICS", "").lower() in ("1", "true", "yes", "on")
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_timings: Dict[str, List[float]] = {}  # stage -> [count, sum, max, *bucket counts]
+
+
+def enable(on: bool = True) -> None:
+    global ENABLED
+    ENABLED = on
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _timings.clear()
+
+
+def incr(name: str, value: float = 1) -> None:
+    """Adds value to a counter (no-op while disabled)."""
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(stage: str, seconds: float) -> None:
+    """Records one duration for a stage (no-op while disabled)."""
+    if not ENABLED:
+        return
+    with _lock:
+        entry = _timings.get(stage)
+        if entry is None:
+            entry = _timings[stage] = [0, 0.0, 0.0] + [0] * len(DEFAULT_BUCKETS)
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] = max(entry[2], seconds)
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if seconds <= bound:
+                entry[3 + i] += 1
+                break
+
+
+class _Timer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(stage: str):
+    """Context manager timing one pass through a stage; shared no-op when disabled."""
+    return _Timer(stage) if ENABLED else _NULL_TIMER
+
+
+def timed(stage: str):
+    """Decorator form of timer() for functions that are a whole stage."""
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(stage, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorate
+
+
+# -----------------------------------------------------------------------------
+# Export
+# -----------------------------------------------------------------------------
+
+def _ratio(numerator: str, denominator: str) -> float:
+    total = _counters.get(denominator, 0)
+    return _counters.get(numerator, 0) / total if total else 0.0
+
+
+def snapshot() -> Dict:
+    """Counters, per-stage timings and derived rates as plain data."""
+    with _lock:
+        stages = {
+            stage: {
+                "count": int(entry[0]),
+                "total_seconds": entry[1],
+                "mean_seconds": entry[1] / entry[0] if entry[0] else 0.0,
+                "max_seconds": entry[2],
+            }
+            for stage, entry in _timings.items()
+        }
+        hits = _counters.get("places_cache_hits", 0)
+        lookups = hits + _counters.get("places_cache_misses", 0)
+        computed = _counters.get("rank_calls", 0) - _counters.get("rank_cache_hits", 0)
+        rates = {
+            "places_cache_hit_rate": hits / lookups if lookups else 0.0,
+            "fuzzy_fallback_rate": _ratio("map_fuzzy", "map_calls"),
+            "everywhere_fallback_rate": (
+                _counters.get("rank_everywhere_fallback", 0) / computed if computed else 0.0
+            ),
+            "rank_cache_hit_rate": _ratio("rank_cache_hits", "rank_calls"),
+            "mean_candidate_columns": (
+                _counters.get("rank_candidate_columns", 0) / computed if computed else 0.0
+            ),
+        }
+        return {"counters": dict(_counters), "stages": stages, "rates": rates}
+
+
+def log_snapshot(stream: Optional[IO[str]] = None, event: str = "metrics") -> None:
+    """Writes the snapshot as one structured JSON log line."""
+    record = {"event": event, "ts": round(time.time(), 3), **snapshot()}
+    print(json.dumps(record, sort_keys=True), file=stream or sys.stderr)
+
+
+def render_prometheus(prefix: str = METRIC_PREFIX) -> str:
+    """Prometheus text exposition of every counter and stage histogram."""
+    lines = []
+    with _lock:
+        for name in sorted(_counters):
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {_counters[name]:g}")
+        if _timings:
+            metric = f"{prefix}_stage_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for stage in sorted(_timings):
+                entry = _timings[stage]
+                cumulative = 0
+                for i, bound in enumerate(DEFAULT_BUCKETS):
+                    cumulative += entry[3 + i]
+                    lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {int(entry[0])}')
+                lines.append(f'{metric}_sum{{stage="{stage}"}} {entry[1]:.9f}')
+                lines.append(f'{metric}_count{{stage="{stage}"}} {int(entry[0])}')
+    return "\n".join(lines) + "\n"
+
+
+# -----------------------------------------------------------------------------
+# Single-run capture
+# -----------------------------------------------------------------------------
+
+@contextmanager
+def capture(profile_path: Optional[str] = None, trace_memory: bool = False) -> Iterator[None]:
+    """
+    Profiles the enclosed block: cProfile stats dumped to profile_path (load
+    with pstats or snakeviz) and, with trace_memory, the top allocation
+    sites printed to stderr.
+    """
+    profiler = None
+    if profile_path:
+        import cProfile
+
+        profiler = cProfile.Profile()
+    if trace_memory:
+        import tracemalloc
+
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+            print(f"Wrote profile to {profile_path}", file=sys.stderr)
+        if trace_memory:
+            snapshot_ = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"Peak traced memory: {peak / 1024:.1f} KiB", file=sys.stderr)
+            for stat in snapshot_.statistics("lineno")[:10]:
+                print(f"  {stat}", file=sys.stderr)
@@ -0,0 +1,220 @@
+"""
+Nearby-merchant recommendations from previously resolved places.
+
+GeoIndex buckets places with coordinates (the Places "geometry" field,
+persisted by PlacesCache) into a fixed lat/lng grid and maps each one to
+reward categories once, at build time. A nearby query scans only the grid
+cells overlapping the search circle, filters by haversine distance and
+ranks every hit in one rank_batch pass, so it never touches the Places API.
+Indexes can be built from the local Places cache or from a JSON fixture.
+
+Usage:
+    python nearby.py 37.7793 -122.4193 --radius 800
+    python nearby.py 37.7793 -122.4193 --places-file fixture_places.json --matrix card_rewards_matrix.csv
+"""
+
+import argparse
+import json
+import math
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from bulk import format_cards
+from map import USER_CARDS, categories_for_place
+from rewards_matrix import get_rewards_matrix
+
+EARTH_RADIUS_M = 6_371_008.8
+# ~1.1 km of latitude per cell: a city-block radius touches a handful of cells
+DEFAULT_CELL_DEGREES = 0.01
+DEFAULT_RADIUS_M = 1000.0
+
+
+def place_location(place: dict) -> Optional[Tuple[float, float]]:
+    """(lat, lng) of a Places candidate, or None if it has no geometry."""
+    location = (place.get("geometry") or {}).get("location") or {}
+    lat, lng = location.get("lat"), location.get("lng")
+    if lat is None or lng is None:
+        return None
+    return float(lat), float(lng)
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in meters; accepts scalars or numpy arrays."""
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GeoIndex:
+    """
+    Grid index over places with coordinates.
+
+    Args:
+        places: Places candidate dicts; ones without geometry are skipped and
+            duplicates (same place_id) are kept once
+        cell_degrees: Grid cell size in degrees
+    """
+
+    def __init__(self, places: Iterable[dict], cell_degrees: float = DEFAULT_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._lng_cells = max(1, int(round(360 / cell_degrees)))
+        self.places: List[dict] = []
+        self.categories: List[List[str]] = []
+        coords: List[Tuple[float, float]] = []
+        seen = set()
+        for place in places:
+            location = place_location(place)
+            if location is None:
+                continue
+            key = place.get("place_id") or (place.get("name"), location)
+            if key in seen:
+                continue
+            seen.add(key)
+            self.places.append(place)
+            self.categories.append(categories_for_place(place.get("name", ""), place.get("types", [])))
+            coords.append(location)
+
+        points = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        self.lat = points[:, 0]
+        self.lng = points[:, 1]
+        cells: Dict[Tuple[int, int], List[int]] = {}
+        for i, (lat, lng) in enumerate(coords):
+            cells.setdefault(self._cell(lat, lng), []).append(i)
+        self._cells = {cell: np.asarray(members, dtype=np.intp) for cell, members in cells.items()}
+
+    @classmethod
+    def from_cache(cls, cache, cell_degrees: float = DEFAULT_CELL_DEGREES) -> "GeoIndex":
+        """Builds the index from every unexpired place in a PlacesCache."""
+        return cls(cache.places(), cell_degrees)
+
+    def __len__(self) -> int:
+        return len(self.places)
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (
+            int(math.floor(lat / self.cell_degrees)),
+            int(math.floor(lng / self.cell_degrees)) % self._lng_cells,
+        )
+
+    def _candidates(self, lat: float, lng: float, radius_m: float) -> np.ndarray:
+        dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+        cos_lat = math.cos(math.radians(min(89.9, abs(lat) + dlat)))
+        dlng = min(180.0, dlat / max(cos_lat, 1e-6))
+        i0, i1 = (int(math.floor((lat + s * dlat) / self.cell_degrees)) for s in (-1, 1))
+        j0, j1 = (int(math.floor((lng + s * dlng) / self.cell_degrees)) for s in (-1, 1))
+        # Longitude cells wrap at the antimeridian
+        columns = {j % self._lng_cells for j in range(j0, min(j1, j0 + self._lng_cells - 1) + 1)}
+        found = [
+            self._cells[(i, j)]
+            for i in range(i0, i1 + 1)
+            for j in columns
+            if (i, j) in self._cells
+        ]
+        return np.concatenate(found) if found else np.zeros(0, dtype=np.intp)
+
+    def query(
+        self, lat: float, lng: float, radius_m: float = DEFAULT_RADIUS_M, limit: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Places within radius_m of (lat, lng).
+
+        Returns:
+            (place index, distance in meters) pairs, nearest first
+        """
+        candidates = self._candidates(lat, lng, radius_m)
+        if not len(candidates):
+            return []
+        distances = haversine_m(lat, lng, self.lat[candidates], self.lng[candidates])
+        inside = distances <= radius_m
+        candidates, distances = candidates[inside], distances[inside]
+        order = np.lexsort((candidates, distances))[:limit]
+        return [(int(candidates[k]), float(distances[k])) for k in order]
+
+
+def nearby_recommendations(
+    index: GeoIndex,
+    lat: float,
+    lng: float,
+    radius_m: float = DEFAULT_RADIUS_M,
+    card_whitelist: Optional[List[str]] = None,
+    top_n: int = 3,
+    limit: Optional[int] = 20,
+    matrix_csv_path: str = "card_rewards_matrix.csv",
+) -> List[Dict]:
+    """
+    Nearby merchants with the best wallet cards for each.
+
+    Args:
+        index: GeoIndex of resolved places
+        lat, lng: Search center
+        radius_m: Search radius in meters
+        card_whitelist: Cards to rank (defaults to USER_CARDS)
+        top_n: Cards per merchant
+        limit: Maximum merchants returned (nearest first)
+        matrix_csv_path: Path to rewards matrix CSV
+
+    Returns:
+        Dicts with place, distance_m, categories and top_cards, nearest first
+    """
+    hits = index.query(lat, lng, radius_m, limit)
+    if not hits:
+        return []
+    wallet = card_whitelist if card_whitelist is not None else USER_CARDS
+    # Nearby merchants share few category sets; rank each distinct set once
+    set_index: Dict[Tuple[str, ...], int] = {}
+    for i, _ in hits:
+        set_index.setdefault(tuple(index.categories[i]), len(set_index))
+    ranked = get_rewards_matrix(matrix_csv_path).rank_batch(
+        [list(cats) for cats in set_index], [wallet], top_n=top_n
+    )
+    return [
+        {
+            "place": index.places[i],
+            "distance_m": round(distance, 1),
+            "categories": index.categories[i],
+            "top_cards": format_cards(ranked[set_index[tuple(index.categories[i])]][0]),
+        }
+        for i, distance in hits
+    ]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Best cards for merchants near a location.")
+    parser.add_argument("lat", type=float)
+    parser.add_argument("lng", type=float)
+    parser.add_argument("--radius", type=float, default=DEFAULT_RADIUS_M, help="Meters")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--top-n", type=int, default=3)
+    parser.add_argument("--places-file", help="JSON list of Places candidates (default: the local Places cache)")
+    parser.add_argument("--matrix", default="card_rewards_matrix.csv", help="Rewards matrix CSV")
+    args = parser.parse_args(argv)
+
+    if args.places_file:
+        with open(args.places_file, encoding="utf-8") as f:
+            index = GeoIndex(json.load(f))
+    else:
+        from places import PlacesCache
+
+        index = GeoIndex.from_cache(PlacesCache())
+
+    results = nearby_recommendations(
+        index, args.lat, args.lng, args.radius,
+        top_n=args.top_n, limit=args.limit, matrix_csv_path=args.matrix,
+    )
+    if not results:
+        print(f"No cached places within {args.radius:g} m ({len(index)} places indexed).")
+        return 0
+    for result in results:
+        place = result["place"]
+        best = result["top_cards"][0] if result["top_cards"] else None
+        line = f"{result['distance_m']:>7.0f} m  {place.get('name')}  [{', '.join(result['categories'])}]"
+        if best:
+            line += f"  -> {best['card']} ({best['reward_rate']})"
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
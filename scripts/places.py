@@ -0,0 +1,387 @@
+"""
+Google Places lookups with a persistent local cache.
+
+Resolved candidates (place_id, name, formatted_address, types, geometry) are stored
+in SQLite keyed by the normalized query text, so repeat lookups skip the
+network entirely. "No place found" (ZERO_RESULTS) answers are cached too.
+
+PlacesClient reuses pooled HTTP connections, retries 429/5xx responses and
+OVER_QUERY_LIMIT/UNKNOWN_ERROR statuses with jittered backoff and resolves
+batches concurrently under a rate limit.
+"""
+
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+PLACES_FIND_URL = "https://maps.googleapis.com/maps/api/place/findplacefromtext/json"
+PLACE_FIELDS = "place_id,name,formatted_address,types,geometry"
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    "PLACES_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".places_cache.sqlite3"),
+)
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+DEFAULT_NEGATIVE_TTL_SECONDS = 24 * 3600
+DEFAULT_MAX_ENTRIES = 100_000
+# Cache hits whose accessed_at update is held back before one batched write
+DEFAULT_TOUCH_BATCH = 256
+
+
+def normalize_query(text: str) -> str:
+    """Cache key for a lookup: lowercased with whitespace collapsed."""
+    return " ".join((text or "").lower().split())
+
+
+class PlacesCache:
+    """
+    SQLite-backed place lookup cache with TTL and LRU eviction.
+
+    The database runs in WAL mode with synchronous=NORMAL, the entry count
+    is kept in memory, and hits only queue their accessed_at update: queued
+    touches are written in one transaction every touch_batch hits, before
+    any eviction and on close, so a hit never costs a commit. LRU order may
+    lag by up to touch_batch hits if the process dies without closing.
+
+    Args:
+        path: SQLite file (":memory:" for a process-local cache)
+        ttl: Seconds a found place stays valid
+        negative_ttl: Seconds a "No place found" answer stays valid
+        max_entries: Entry count above which least recently used rows are evicted
+        clock: Time source, injectable for tests
+        touch_batch: Hits whose accessed_at updates are buffered before being written
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        ttl: float = DEFAULT_TTL_SECONDS,
+        negative_ttl: float = DEFAULT_NEGATIVE_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        clock: Callable[[], float] = time.time,
+        touch_batch: int = DEFAULT_TOUCH_BATCH,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.touch_batch = max(1, touch_batch)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # In-memory databases ignore WAL and keep their default journal
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS places ("
+            " key TEXT PRIMARY KEY,"
+            " place TEXT,"
+            " stored_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS places_accessed ON places (accessed_at)"
+        )
+        self._conn.commit()
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM places").fetchone()
+
+    def _flush_touches(self) -> None:
+        """Writes queued accessed_at updates; the caller holds the lock and commits."""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE places SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def get(self, text: str) -> Tuple[bool, Optional[dict]]:
+        """
+        Looks up a query.
+
+        Returns:
+            (found, place): found is False on a miss or expired entry;
+            place is None for a cached "No place found"
+        """
+        key = normalize_query(text)
+        now = self.clock()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT place, stored_at FROM places WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                place_json, stored_at = row
+                ttl = self.ttl if place_json is not None else self.negative_ttl
+                if now - stored_at < ttl:
+                    self._touched[key] = now
+                    if len(self._touched) >= self.touch_batch:
+                        self._flush_touches()
+                        self._conn.commit()
+                    self.hits += 1
+                    return True, json.loads(place_json) if place_json is not None else None
+                self._touched.pop(key, None)
+                self._count -= self._conn.execute("DELETE FROM places WHERE key = ?", (key,)).rowcount
+                self._conn.commit()
+            self.misses += 1
+            return False, None
+
+    def put(self, text: str, place: Optional[dict]) -> None:
+        """Stores a lookup result (None records "No place found")."""
+        key = normalize_query(text)
+        now = self.clock()
+        place_json = json.dumps(place) if place is not None else None
+        with self._lock:
+            self._touched.pop(key, None)
+            exists = self._conn.execute("SELECT 1 FROM places WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO places (key, place, stored_at, accessed_at)"
+                " VALUES (?, ?, ?, ?)",
+                (key, place_json, now, now),
+            )
+            if exists is None:
+                self._count += 1
+            if self._count > self.max_entries:
+                # Eviction reads accessed_at, so queued touches must land first
+                self._flush_touches()
+                self._count -= self._conn.execute(
+                    "DELETE FROM places WHERE key IN ("
+                    " SELECT key FROM places ORDER BY accessed_at ASC LIMIT ?)",
+                    (self._count - self.max_entries,),
+                ).rowcount
+            self._conn.commit()
+
+    def places(self) -> List[dict]:
+        """Every unexpired cached place (not "No place found" answers), without touching LRU order."""
+        cutoff = self.clock() - self.ttl
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT place FROM places WHERE place IS NOT NULL AND stored_at > ?", (cutoff,)
+            ).fetchall()
+        return [json.loads(place_json) for (place_json,) in rows]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters since this cache was opened."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_touches()
+            self._conn.commit()
+            self._conn.close()
+
+
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+# The API's own rate-limit / transient signals, sent with HTTP 200
+RETRYABLE_API_STATUS = frozenset({"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"})
+
+
+class PlacesLookupError(Exception):
+    """Raised when a lookup still fails after all retries."""
+
+
+class _RateLimiter:
+    """Thread-safe token bucket allowing `rate` acquisitions per second."""
+
+    def __init__(self, rate: Optional[float], burst: int = 1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+class PlacesClient:
+    """
+    Places findplacefromtext client.
+
+    Args:
+        api_key: Google Places API key
+        cache: Optional PlacesCache consulted before the network
+        url: findplacefromtext endpoint (override to point at a fake server)
+        timeout: HTTP timeout in seconds
+        max_retries: Retries after the first attempt on 429/5xx/connection errors
+            and OVER_QUERY_LIMIT/UNKNOWN_ERROR statuses
+        backoff_base: Base delay in seconds; attempt n waits up to base * 2**n
+        backoff_max: Cap on a single backoff delay
+        rate_limit: Max requests per second across all threads (None = unlimited)
+        pool_size: Pooled connections kept open to the API host
+        sleep: Sleep function, injectable for tests
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        cache: Optional[PlacesCache] = None,
+        url: str = PLACES_FIND_URL,
+        timeout: float = 10,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        rate_limit: Optional[float] = None,
+        pool_size: int = 16,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.api_key = api_key
+        self.cache = cache
+        self.url = url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.requests_sent = 0
+        self._sleep = sleep
+        self._limiter = _RateLimiter(rate_limit, burst=pool_size, sleep=sleep)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(self.backoff_max, float(retry_after))
+            except ValueError:
+                pass
+        # Full jitter keeps concurrent workers from retrying in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _request(self, address: str) -> dict:
+        params = {
+            "input": address,
+            "inputtype": "textquery",
+            "fields": PLACE_FIELDS,
+            "key": self.api_key,
+        }
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            self._limiter.acquire()
+            self.requests_sent += 1
+            try:
+                resp = self.session.get(self.url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                if last_attempt:
+                    raise PlacesLookupError(f"Places lookup failed for {address!r}: {exc}") from exc
+                self._sleep(self._backoff(attempt))
+                continue
+            if resp.status_code in RETRYABLE_STATUS and not last_attempt:
+                self._sleep(self._backoff(attempt, resp.headers.get("Retry-After")))
+                continue
+            if resp.status_code in RETRYABLE_STATUS:
+                raise PlacesLookupError(
+                    f"Places lookup failed for {address!r}: HTTP {resp.status_code}"
+                )
+            resp.raise_for_status()
+            body = resp.json()
+            if body.get("status") in RETRYABLE_API_STATUS and not last_attempt:
+                self._sleep(self._backoff(attempt))
+                continue
+            return body
+        raise PlacesLookupError(f"Places lookup failed for {address!r}")
+
+    @metrics.timed("places_lookup")
+    def lookup(self, address: str) -> Optional[dict]:
+        """
+        Resolves free text to the best Places candidate. Failed requests and
+        API error statuses (OVER_QUERY_LIMIT, REQUEST_DENIED, ...) raise
+        PlacesLookupError and are never cached.
+
+        Returns:
+            The first candidate dict, or None if no place was found
+        """
+        if self.cache is not None:
+            found, place = self.cache.get(address)
+            if found:
+                metrics.incr("places_cache_hits")
+                return place
+        metrics.incr("places_cache_misses")
+
+        body = self._request(address)
+        status = body.get("status")
+        # Quota/auth/request errors also come back as HTTP 200 with no
+        # candidates; only a real ZERO_RESULTS answer means "no place"
+        if status not in ("OK", "ZERO_RESULTS"):
+            detail = body.get("error_message")
+            raise PlacesLookupError(
+                f"Places lookup failed for {address!r}: {status}" + (f" ({detail})" if detail else "")
+            )
+        cands = body.get("candidates", [])
+        place = cands[0] if cands else None  # Use the best match
+
+        if self.cache is not None and (place is not None or status == "ZERO_RESULTS"):
+            self.cache.put(address, place)
+        return place
+
+    def lookup_many(
+        self,
+        addresses: Sequence[str],
+        concurrency: int = 8,
+        return_exceptions: bool = False,
+    ) -> List[Union[Optional[dict], Exception]]:
+        """
+        Resolves a batch of addresses in parallel, in input order.
+
+        Queries that normalize to the same cache key are looked up once.
+
+        Args:
+            addresses: Texts to resolve
+            concurrency: Worker threads issuing requests
+            return_exceptions: Put a failed lookup's exception in its slot
+                instead of raising it
+
+        Returns:
+            One candidate dict (or None) per address
+        """
+        unique: Dict[str, str] = {}
+        for address in addresses:
+            unique.setdefault(normalize_query(address), address)
+
+        def resolve(address: str):
+            try:
+                return self.lookup(address)
+            except Exception as exc:
+                if not return_exceptions:
+                    raise
+                return exc
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            resolved = dict(zip(unique, pool.map(resolve, unique.values())))
+        return [resolved[normalize_query(address)] for address in addresses]
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,163 @@
+"""
+Offline recommendation packs.
+
+Precomputes get_best_cards_for_category for one wallet over every category
+set a place can map to, so a client can recommend with no network calls.
+categories_for_place yields either one category or a (brand, default) pair,
+where brand categories come from BRAND_OVERRIDES and default categories from
+TYPE_TO_CATEGORY, the CATEGORIES fuzzy list and "Other purchases"; every
+single category and every brand/default pair is ranked in one rank_batch
+pass.
+
+Pack layout (compact JSON):
+    format, version       "cardgenius-recommendation-pack", PACK_FORMAT_VERSION
+    content_hash          SHA-256 of everything else; clients refetch when it changes
+    matrix_hash, top_n, wallet
+    cards, offers         string tables referenced by index
+    results               unique rankings, each a list of [card, rate, offer] indices
+    index                 pack_key(categories) -> results position
+
+Usage:
+    python recommendation_pack.py -o pack.json
+    python recommendation_pack.py --cards "Chase Sapphire Reserve®" "Target REDcard" -o pack.json
+    python recommendation_pack.py --wallet-file cards.json -o pack.json   # Supabase cards rows
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from map import USER_CARDS
+from map_to_category import BRAND_OVERRIDES, CATEGORIES, TYPE_TO_CATEGORY
+from rewards_matrix import get_rewards_matrix
+
+PACK_FORMAT = "cardgenius-recommendation-pack"
+PACK_FORMAT_VERSION = 1
+
+
+def pack_key(categories: Sequence[str]) -> str:
+    """Index key of a category set: normalized, deduplicated, sorted, "|"-joined."""
+    return "|".join(sorted({(c or "").strip().lower() for c in categories}))
+
+
+def reachable_category_sets() -> List[List[str]]:
+    """Every category list categories_for_place can return, each set once."""
+    brands = sorted(set(BRAND_OVERRIDES.values()))
+    defaults = sorted(set(TYPE_TO_CATEGORY.values()) | set(CATEGORIES) | {"Other purchases"})
+    sets: Dict[str, List[str]] = {}
+    for category in defaults + brands:
+        sets.setdefault(pack_key([category]), [category])
+    for brand in brands:
+        for default in defaults:
+            sets.setdefault(pack_key([brand, default]), [brand, default])
+    return list(sets.values())
+
+
+def _pack_hash(pack: Dict) -> str:
+    body = {k: v for k, v in pack.items() if k != "content_hash"}
+    canonical = json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def build_pack(
+    wallet: Optional[List[str]] = None,
+    top_n: int = 20,
+    matrix_csv_path: str = "card_rewards_matrix.csv",
+) -> Dict:
+    """
+    Ranks the wallet for every reachable category set.
+
+    Args:
+        wallet: Card names (defaults to USER_CARDS)
+        top_n: Number of top cards kept per category set
+        matrix_csv_path: Path to rewards matrix CSV
+
+    Returns:
+        The pack as a JSON-ready dict
+    """
+    wallet = list(wallet) if wallet is not None else USER_CARDS
+    matrix = get_rewards_matrix(matrix_csv_path)
+    category_sets = reachable_category_sets()
+    ranked = matrix.rank_batch(category_sets, [wallet], top_n=top_n)
+
+    cards: Dict[str, int] = {}
+    offers: Dict[str, int] = {}
+    results: Dict[Tuple, int] = {}
+    index: Dict[str, int] = {}
+    for categories, per_wallet in zip(category_sets, ranked):
+        encoded = tuple(
+            (cards.setdefault(card, len(cards)), rate, offers.setdefault(offer, len(offers)))
+            for card, rate, offer in per_wallet[0]
+        )
+        index[pack_key(categories)] = results.setdefault(encoded, len(results))
+
+    pack = {
+        "format": PACK_FORMAT,
+        "version": PACK_FORMAT_VERSION,
+        "matrix_hash": matrix.content_hash,
+        "top_n": top_n,
+        "wallet": wallet,
+        "cards": list(cards),
+        "offers": list(offers),
+        "results": [[list(entry) for entry in result] for result in results],
+        "index": index,
+    }
+    pack["content_hash"] = _pack_hash(pack)
+    return pack
+
+
+def lookup(pack: Dict, categories: Sequence[str]) -> Optional[List[Tuple[str, float, str]]]:
+    """
+    Reads a ranking back out of a pack, in the get_best_cards_for_category
+    shape; None if the category set is not in the pack.
+    """
+    position = pack["index"].get(pack_key(categories))
+    if position is None:
+        return None
+    return [
+        (pack["cards"][card], rate, pack["offers"][offer])
+        for card, rate, offer in pack["results"][position]
+    ]
+
+
+def write_pack(pack: Dict, path: str) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(pack, f, separators=(",", ":"), ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_wallet_file(path: str) -> List[str]:
+    """A JSON list of card names, or of rows with a card_name field (Supabase cards export)."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return [row["card_name"] if isinstance(row, dict) else str(row) for row in data]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Export an offline recommendation pack for a wallet.")
+    parser.add_argument("-o", "--output", default="recommendation_pack.json")
+    parser.add_argument("--cards", nargs="+", help="Wallet card names (default: USER_CARDS)")
+    parser.add_argument("--wallet-file", help="JSON list of card names or of {card_name: ...} rows")
+    parser.add_argument("--top-n", type=int, default=20)
+    parser.add_argument("--matrix", default="card_rewards_matrix.csv", help="Rewards matrix CSV")
+    args = parser.parse_args(argv)
+
+    wallet = args.cards
+    if args.wallet_file:
+        wallet = _read_wallet_file(args.wallet_file)
+
+    pack = build_pack(wallet, top_n=args.top_n, matrix_csv_path=args.matrix)
+    write_pack(pack, args.output)
+    print(
+        f"Wrote {args.output}: {len(pack['index'])} category sets, "
+        f"{len(pack['results'])} unique rankings, hash {pack['content_hash'][:12]}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
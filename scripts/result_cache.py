@@ -0,0 +1,130 @@
+"""
+Bounded LRU cache for ranking results.
+
+Entries are evicted least-recently-used first when either the entry count or
+the estimated memory footprint exceeds its cap. Thread-safe, so it can sit
+behind the recommendation server.
+
+Callers whose data changes underneath the cache can pass a generation to
+get/put: it is compared with the cache's generation (set by rekey/clear)
+under the cache lock, so a result computed from data older than the last
+invalidation is neither served nor stored.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+DEFAULT_MAX_ENTRIES = 50_000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def estimate_size(value: Any) -> int:
+    """Rough deep size in bytes of nested tuples/lists of str/float/int."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (tuple, list)):
+        size += sum(estimate_size(item) for item in value)
+    return size
+
+
+class ResultCache:
+    """
+    LRU cache with entry-count and memory caps.
+
+    Args:
+        max_entries: Maximum number of cached results
+        max_bytes: Maximum estimated size of keys plus values
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        # None until a rekey/clear sets one; until then every generation matches
+        self.generation: Optional[int] = None
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _current(self, generation: Optional[int]) -> bool:
+        return generation is None or self.generation is None or generation == self.generation
+
+    def get(self, key: Hashable, generation: Optional[int] = None) -> Optional[Any]:
+        """Returns the cached value (marking it recently used) or None."""
+        with self._lock:
+            entry = self._entries.get(key) if self._current(generation) else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        """Stores value, unless generation is given and no longer current."""
+        size = estimate_size(key) + estimate_size(value)
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        with self._lock:
+            if not self._current(generation):
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def rekey(
+        self, fn: Callable[[Hashable], Optional[Hashable]], generation: Optional[int] = None
+    ) -> int:
+        """
+        Rewrites every key as fn(key), keeping LRU order; entries for which
+        fn returns None are dropped. A given generation becomes current in
+        the same critical section.
+
+        Returns:
+            Number of entries dropped
+        """
+        dropped = 0
+        with self._lock:
+            entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+            for key, entry in self._entries.items():
+                new_key = fn(key)
+                if new_key is None:
+                    self._bytes -= entry[1]
+                    dropped += 1
+                else:
+                    entries[new_key] = entry
+            self._entries = entries
+            if generation is not None:
+                self.generation = generation
+        return dropped
+
+    def clear(self, generation: Optional[int] = None) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if generation is not None:
+                self.generation = generation
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss/eviction counters and current footprint."""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
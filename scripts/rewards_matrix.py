@@ -0,0 +1,1022 @@
+"""
+In-memory rewards matrix used by the card ranking code.
+
+The CSV is parsed once into a dense float32 array (cards x reward columns)
+with a card-name index and a column index. Lookups are array indexing plus
+a max-reduce; the file is re-read only when its mtime changes.
+
+The CSV can also be compiled into a binary artifact (see compile_matrix):
+a small header with the card-name and column tables followed by the raw
+float32 array, which is loaded with np.memmap so every worker process
+shares one page-cached copy. A compiled "<name>.rmx" next to the CSV is
+used automatically while it records the CSV's current mtime and the current
+format version; otherwise it is stale and the CSV is parsed instead.
+
+Usage:
+    python rewards_matrix.py card_rewards_matrix.csv [-o card_rewards_matrix.rmx]
+"""
+
+import copy
+import hashlib
+import itertools
+import json
+import os
+import struct
+import sys
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from map_to_category import (
+    BRAND_OVERRIDES,
+    CATEGORIES,
+    FALLBACK_KEYWORDS,
+    TYPE_TO_CATEGORY,
+    build_search_terms,
+)
+import metrics
+from result_cache import ResultCache
+
+CARD_NAME_COLUMN = "Card Name"
+
+# Upper bound on elements materialized per masked max-reduce chunk in rank_batch
+_BATCH_CHUNK_ELEMENTS = 1 << 24
+
+# Binary artifact layout: magic, format version, header length, JSON header,
+# zero padding up to data_offset, then the C-order float32 values
+MATRIX_BINARY_SUFFIX = ".rmx"
+MATRIX_FORMAT_VERSION = 1
+_MATRIX_MAGIC = b"RWDMTX\0\0"
+_PREAMBLE = struct.Struct("<8sII")
+_DATA_ALIGNMENT = 64
+
+# Same clean-up the ranking code has always applied to reward cells ("4x", "1,000")
+_NUMBER_RE = r"(-?\d+(?:\.\d+)?)"
+
+
+def _clean_column(series) -> np.ndarray:
+    """Converts one raw CSV column to float32 reward rates (unparseable -> 0)."""
+    import pandas as pd
+
+    cleaned = (
+        series.astype(str)
+        .str.replace(",", "", regex=False)
+        .str.extract(_NUMBER_RE, expand=False)
+    )
+    return pd.to_numeric(cleaned, errors="coerce").fillna(0.0).to_numpy(dtype=np.float32)
+
+
+@lru_cache(maxsize=None)
+def _rate_value(value: float) -> float:
+    """
+    Converts a float32 matrix cell back to the Python float it was parsed from.
+
+    float32 cannot hold values like 2.4 exactly; going through the shortest
+    float32 repr keeps returned rates identical to the CSV text. Cached per
+    distinct value, of which a rewards matrix has only a few dozen.
+    """
+    return float(str(np.float32(value)))
+
+
+def _to_float(value) -> float:
+    return _rate_value(float(value))
+
+
+@lru_cache(maxsize=None)
+def _rate_label(value: float) -> str:
+    """Formats a float32 rate for offer text, dropping trailing zeros (4.0 -> "4")."""
+    rate = _rate_value(value)
+    if rate == int(rate):
+        return str(int(rate))
+    return str(rate).rstrip("0").rstrip(".")
+
+
+def _load_csv(path: str) -> Tuple[List[str], List[str], np.ndarray]:
+    """
+    Parses a rewards matrix CSV.
+
+    Returns:
+        (card names, reward column names, float32 values of shape (cards, columns))
+    """
+    import pandas as pd
+
+    df = pd.read_csv(path)
+    if CARD_NAME_COLUMN not in df.columns:
+        raise ValueError("Matrix CSV must have a 'Card Name' column.")
+
+    columns = [col for col in df.columns if col != CARD_NAME_COLUMN]
+    values = np.zeros((len(df), len(columns)), dtype=np.float32)
+    for j, column in enumerate(columns):
+        values[:, j] = _clean_column(df[column])
+    return df[CARD_NAME_COLUMN].astype(str).tolist(), columns, values
+
+
+def _content_hash(card_names: List[str], columns: List[str], values: np.ndarray) -> str:
+    digest = hashlib.sha256()
+    digest.update("\0".join(card_names).encode("utf-8"))
+    digest.update(b"\1")
+    digest.update("\0".join(columns).encode("utf-8"))
+    digest.update(b"\1")
+    digest.update(np.ascontiguousarray(values, dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+
+def _read_header(path: str) -> Optional[dict]:
+    """Returns the JSON header of a compiled matrix, or None if path is not one."""
+    try:
+        with open(path, "rb") as f:
+            preamble = f.read(_PREAMBLE.size)
+            if len(preamble) < _PREAMBLE.size:
+                return None
+            magic, version, header_len = _PREAMBLE.unpack(preamble)
+            if magic != _MATRIX_MAGIC:
+                return None
+            if version != MATRIX_FORMAT_VERSION:
+                raise ValueError(
+                    f"{path}: matrix format version {version}, expected {MATRIX_FORMAT_VERSION}"
+                )
+            return json.loads(f.read(header_len).decode("utf-8"))
+    except FileNotFoundError:
+        return None
+
+
+def read_matrix_binary(path: str) -> Tuple[dict, np.ndarray]:
+    """
+    Opens a compiled matrix.
+
+    Returns:
+        (header dict, read-only float32 memmap of shape (n_cards, n_columns))
+    """
+    header = _read_header(path)
+    if header is None:
+        raise ValueError(f"{path} is not a compiled rewards matrix")
+    shape = (header["n_cards"], header["n_columns"])
+    if 0 in shape:
+        return header, np.zeros(shape, dtype=np.float32)
+    values = np.memmap(path, dtype="<f4", mode="r", offset=header["data_offset"], shape=shape)
+    return header, values
+
+
+def write_matrix_binary(
+    path: str,
+    card_names: List[str],
+    columns: List[str],
+    values: np.ndarray,
+    source_mtime_ns: Optional[int] = None,
+) -> None:
+    """Writes a compiled matrix atomically (readers never see a partial file)."""
+    values = np.ascontiguousarray(values, dtype="<f4")
+    header = {
+        "format_version": MATRIX_FORMAT_VERSION,
+        "n_cards": len(card_names),
+        "n_columns": len(columns),
+        "card_names": list(card_names),
+        "columns": list(columns),
+        "content_hash": _content_hash(card_names, columns, values),
+        "source_mtime_ns": source_mtime_ns,
+        "data_offset": 0,
+    }
+    # data_offset is part of the header, so size the header with a placeholder first
+    for _ in range(2):
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        data_offset = _PREAMBLE.size + len(header_bytes)
+        data_offset += -data_offset % _DATA_ALIGNMENT
+        if header["data_offset"] == data_offset:
+            break
+        header["data_offset"] = data_offset
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(_MATRIX_MAGIC, MATRIX_FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * (header["data_offset"] - f.tell()))
+        f.write(values.tobytes())
+    os.replace(tmp_path, path)
+
+
+def compiled_path_for(csv_path: str) -> str:
+    return os.path.splitext(csv_path)[0] + MATRIX_BINARY_SUFFIX
+
+
+def _binary_source(path: str) -> Optional[str]:
+    """
+    Picks the compiled artifact to load for path: path itself if it is one
+    (a format version mismatch raises), else a sibling .rmx compiled from
+    the current version of the CSV.
+    """
+    if _read_header(path) is not None:
+        return path
+    compiled = compiled_path_for(path)
+    if compiled == path:
+        return None
+    try:
+        header = _read_header(compiled)
+    except ValueError:
+        # Written by another format version: stale, like an mtime mismatch
+        return None
+    if header is not None and header.get("source_mtime_ns") == os.stat(path).st_mtime_ns:
+        return compiled
+    return None
+
+
+def compile_matrix(csv_path: str, out_path: Optional[str] = None) -> str:
+    """
+    Compiles a rewards matrix CSV into the binary artifact.
+
+    Returns:
+        Path of the written artifact
+    """
+    out_path = out_path or compiled_path_for(csv_path)
+    source_mtime_ns = os.stat(csv_path).st_mtime_ns
+    card_names, columns, values = _load_csv(csv_path)
+    write_matrix_binary(out_path, card_names, columns, values, source_mtime_ns)
+    return out_path
+
+
+def _top_k_stable(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Row-wise top-k column indices, highest first, ties broken by column order.
+
+    Equivalent to np.argsort(-scores, kind="stable")[:, :k] but uses
+    argpartition so the cost is linear in the row width.
+    """
+    n_rows, width = scores.shape
+    if k >= width:
+        return np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    threshold = np.take_along_axis(scores, part, axis=1).min(axis=1)[:, None]
+    above = scores > threshold
+    # Among values equal to the k-th best, keep the earliest columns
+    ties = scores == threshold
+    room = k - above.sum(axis=1, keepdims=True)
+    take = above | (ties & (np.cumsum(ties, axis=1) <= room))
+    picked = np.nonzero(take)[1].reshape(n_rows, k)
+    picked_scores = np.take_along_axis(scores, picked, axis=1)
+    order = np.argsort(-picked_scores, axis=1, kind="stable")
+    return np.take_along_axis(picked, order, axis=1)
+
+
+def _card_index(card_names: List[str]) -> Dict[str, List[int]]:
+    card_index: Dict[str, List[int]] = {}
+    for row, name in enumerate(card_names):
+        card_index.setdefault(name.lower(), []).append(row)
+    return card_index
+
+
+def _fallback_columns(columns_lower: List[str]) -> List[int]:
+    return [
+        j
+        for j, col in enumerate(columns_lower)
+        if any(keyword in col for keyword in FALLBACK_KEYWORDS)
+    ]
+
+
+# Snapshot generations, unique across every RewardsMatrix in the process
+_GENERATIONS = itertools.count(1)
+
+
+def _read_only(values: np.ndarray) -> np.ndarray:
+    if values.flags.writeable:
+        values.flags.writeable = False
+    return values
+
+
+class MatrixSnapshot:
+    """
+    One immutable version of the rewards matrix: the values plus every index
+    derived from them.
+
+    RewardsMatrix answers each call from a single snapshot and publishes
+    updates as a new snapshot with one reference swap, so a reader on another
+    thread never mixes values and indexes from different versions. Nothing is
+    written after construction except the category_index memo, whose entries
+    depend only on the columns.
+
+    Attributes:
+        card_names: Card names in CSV row order
+        columns: Reward column names in CSV order (without "Card Name")
+        values: Read-only float32 array of shape (len(card_names), len(columns))
+        card_index: Lowercased card name -> row indices
+        column_index: Column name -> column index
+        category_index: Normalized category -> (matched column indices,
+            fallback column indices), prebuilt for every known category
+        content_hash: SHA-256 of card names, columns and values
+        generation: Unique id of this snapshot; result cache entries are
+            stamped with it
+    """
+
+    def __init__(
+        self,
+        card_names: List[str],
+        columns: List[str],
+        values: np.ndarray,
+        content_hash: Optional[str] = None,
+    ):
+        self.card_names = list(card_names)
+        self.columns = list(columns)
+        self.values = _read_only(values)
+        if content_hash is None:
+            content_hash = _content_hash(self.card_names, self.columns, self.values)
+        self.content_hash = content_hash
+        self.generation = next(_GENERATIONS)
+        self.card_index = _card_index(self.card_names)
+        self.column_index = {col: j for j, col in enumerate(self.columns)}
+        self._columns_lower = [col.lower() for col in self.columns]
+        self._fallback_columns = _fallback_columns(self._columns_lower)
+        self.category_index: Dict[str, Tuple[List[int], List[int]]] = {}
+        known = set(CATEGORIES) | set(TYPE_TO_CATEGORY.values()) | set(BRAND_OVERRIDES.values())
+        known.add("Other purchases")
+        for category in known:
+            self.category_columns(category)
+
+    def replace(self, **changes) -> "MatrixSnapshot":
+        """
+        Copy with some attributes swapped; the caller passes every derived
+        index the change affects. content_hash is recomputed.
+        """
+        snapshot = copy.copy(self)
+        for name, value in changes.items():
+            setattr(snapshot, name, value)
+        snapshot.values = _read_only(snapshot.values)
+        snapshot.content_hash = _content_hash(snapshot.card_names, snapshot.columns, snapshot.values)
+        snapshot.generation = next(_GENERATIONS)
+        return snapshot
+
+    def rows_for(self, card_name: str) -> List[int]:
+        rows = self.card_index.get(card_name.lower())
+        if not rows:
+            raise KeyError(f"Unknown card: {card_name!r}")
+        return rows
+
+    def column_for(self, column: str) -> int:
+        j = self.column_index.get(column)
+        if j is None:
+            raise KeyError(f"Unknown reward column: {column!r}")
+        return j
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    def match_columns(self, search_terms: Sequence[str]) -> List[int]:
+        """Returns indices of columns containing any search term (case-insensitive)."""
+        lowered = [term.lower() for term in search_terms]
+        return [
+            j
+            for j, col in enumerate(self._columns_lower)
+            if any(term in col for term in lowered)
+        ]
+
+    def category_columns(self, category: str) -> Tuple[List[int], List[int]]:
+        """
+        Looks up the reward columns for one category.
+
+        Known categories are resolved at load time; anything else is resolved
+        on first use and memoized for this snapshot's columns.
+
+        Returns:
+            (indices of columns matching the category's search terms,
+             indices of generic fallback columns)
+        """
+        key = (category or "").strip().lower()
+        entry = self.category_index.get(key)
+        if entry is None:
+            terms = build_search_terms(category, self.columns)
+            entry = (self.match_columns(terms), self._fallback_columns)
+            self.category_index[key] = entry
+        return entry
+
+    def columns_for_categories(self, categories: Sequence[str]) -> Tuple[List[int], List[int]]:
+        """Unions the matched columns of several categories (column order preserved)."""
+        if len(categories) == 1:
+            return self.category_columns(categories[0])
+        matched = set()
+        for category in categories:
+            matched.update(self.category_columns(category)[0])
+        return sorted(matched), self._fallback_columns
+
+    def select_rows(
+        self, card_whitelist: Optional[Sequence[str]]
+    ) -> Tuple[List[int], List[str]]:
+        """
+        Resolves a whitelist to matrix rows.
+
+        Returns:
+            (row indices in CSV order, whitelisted names missing from the matrix)
+        """
+        if not card_whitelist:
+            return list(range(len(self.card_names))), []
+        rows = set()
+        missing: List[str] = []
+        for name in card_whitelist:
+            found = self.card_index.get(name.lower())
+            if found:
+                rows.update(found)
+            else:
+                missing.append(name)
+        return sorted(rows), missing
+
+    def offer_text(self, row: int, columns: Sequence[int]) -> str:
+        """
+        Builds offer text for one card from the given reward columns.
+
+        Returns:
+            Formatted offer text like "4% — Restaurants | 1% — Everywhere"
+        """
+        return self.offer_texts([row], columns)[0]
+
+    def offer_texts(self, rows: Sequence[int], columns: Sequence[int]) -> List[str]:
+        """
+        Builds offer text for several cards from the same reward columns.
+
+        Only the card x matched-column block is read, so the cost per card
+        depends on how many columns the category matched, not on the total
+        column count.
+        """
+        if not len(rows) or not len(columns):
+            return [""] * len(rows)
+        columns = np.asarray(columns, dtype=np.intp)
+        block = self.values[np.ix_(rows, columns)]
+        # Highest rate first, ties in column order; positive rates sort first
+        order = np.argsort(-block, axis=1, kind="stable")
+        counts = (block > 0).sum(axis=1)
+        texts = []
+        for i in range(len(rows)):
+            picked = order[i, : counts[i]]
+            texts.append(" | ".join(
+                f"{_rate_label(float(block[i, k]))}% — {self.columns[columns[k]]}"
+                for k in picked
+            ))
+        return texts
+
+    def rank(
+        self,
+        search_terms: Sequence[str],
+        card_whitelist: Optional[Sequence[str]] = None,
+        top_n: int = 20,
+    ) -> List[Tuple[str, float, str]]:
+        """
+        Ranks cards by their best reward rate across columns matching search_terms.
+
+        Args:
+            search_terms: Category terms matched against column names
+            card_whitelist: Optional list of cards to restrict to; whitelisted
+                cards missing from the matrix are returned with a zero rate
+            top_n: Number of top cards to return
+
+        Returns:
+            List of tuples: (card_name, reward_rate, offer_text), sorted by reward rate descending
+        """
+        metrics.incr("rank_calls")
+        return self.rank_columns(
+            self.match_columns(search_terms), self._fallback_columns, card_whitelist, top_n
+        )
+
+    def rank_columns(
+        self,
+        term_columns: List[int],
+        fallback_columns: List[int],
+        card_whitelist: Optional[Sequence[str]],
+        top_n: int,
+    ) -> List[Tuple[str, float, str]]:
+        """rank() over already resolved (term, fallback) column lists."""
+        rows, missing = self.select_rows(card_whitelist)
+        if not rows and not missing:
+            return []
+
+        # Fallback to generic "everywhere" columns if no specific match
+        candidate_columns = term_columns or fallback_columns
+        if metrics.ENABLED:
+            metrics.incr("rank_candidate_columns", len(candidate_columns))
+            # build_search_terms always adds the generic terms, so a category
+            # with no specific column still "matches" the Everywhere columns
+            fallback = set(fallback_columns)
+            if candidate_columns and all(j in fallback for j in candidate_columns):
+                metrics.incr("rank_everywhere_fallback")
+        if not candidate_columns:
+            return []
+
+        scores = np.zeros(len(rows) + len(missing), dtype=np.float32)
+        if rows:
+            scores[: len(rows)] = self.values[np.ix_(rows, candidate_columns)].max(axis=1)
+        names = [self.card_names[r] for r in rows] + list(missing)
+
+        # Stable descending sort keeps matrix order among equal rates
+        order = np.argsort(-scores, kind="stable")[:top_n]
+
+        return self._build_results(order, scores, rows, names, term_columns)
+
+    def _build_results(
+        self,
+        order: Sequence[int],
+        scores: np.ndarray,
+        rows: List[int],
+        names: List[str],
+        term_columns: List[int],
+    ) -> List[Tuple[str, float, str]]:
+        """Turns ranked positions into (card_name, reward_rate, offer_text) tuples."""
+        # Offer text only lists the searched categories, never the fallback ones
+        with_offer = [i for i in order if scores[i] > 0 and i < len(rows)]
+        texts = dict(zip(with_offer, self.offer_texts([rows[i] for i in with_offer], term_columns)))
+        return [(names[i], _to_float(scores[i]), texts.get(i, "")) for i in order]
+
+    # ------------------------------------------------------------------
+    # Batch ranking
+    # ------------------------------------------------------------------
+    def rank_batch(
+        self,
+        category_sets: Sequence[Sequence[str]],
+        card_whitelists: Sequence[Optional[Sequence[str]]],
+        top_n: int = 20,
+    ) -> List[List[List[Tuple[str, float, str]]]]:
+        """
+        Ranks every (category set, whitelist) pair in one vectorized pass.
+
+        Per-card scores for all category sets come from a single masked
+        max-reduce over the matrix; each whitelist then takes an
+        argpartition top-k over its cards. Results match rank_categories()
+        for every pair, including tie order.
+
+        Args:
+            category_sets: N lists of categories considered together
+            card_whitelists: M whitelists (None/empty means every card)
+            top_n: Number of top cards to return per pair
+
+        Returns:
+            results[n][m]: List of tuples (card_name, reward_rate, offer_text)
+        """
+        resolved = [self.columns_for_categories(list(cats)) for cats in category_sets]
+        candidate_sets = [term or fallback for term, fallback in resolved]
+        metrics.incr("rank_batch_pairs", len(category_sets) * len(card_whitelists))
+        selections = [self.select_rows(whitelist) for whitelist in card_whitelists]
+
+        # Only score the cards some whitelist actually asks for
+        needed = sorted({row for rows, _ in selections for row in rows})
+        position = {row: i for i, row in enumerate(needed)}
+
+        scores = self._masked_max(self.values[needed], self._column_mask(candidate_sets))
+
+        results: List[List[List[Tuple[str, float, str]]]] = [
+            [[] for _ in card_whitelists] for _ in category_sets
+        ]
+        active = [n for n, columns in enumerate(candidate_sets) if columns]
+        if not active or top_n <= 0:
+            return results
+
+        for m, (rows, missing) in enumerate(selections):
+            width = len(rows) + len(missing)
+            k = min(top_n, width)
+            if k == 0:
+                continue
+            # Missing whitelist cards score zero and sort after matrix cards
+            sub = np.zeros((len(active), width), dtype=np.float32)
+            if rows:
+                sub[:, : len(rows)] = scores[np.ix_(active, [position[r] for r in rows])]
+            top = _top_k_stable(sub, k)
+            names = [self.card_names[r] for r in rows] + list(missing)
+            for i, n in enumerate(active):
+                results[n][m] = self._build_results(top[i], sub[i], rows, names, resolved[n][0])
+        return results
+
+    def rate_table(
+        self, category_sets: Sequence[Sequence[str]], rows: Sequence[int]
+    ) -> np.ndarray:
+        """
+        Best reward rate of each card for each category set.
+
+        Args:
+            category_sets: N lists of categories considered together
+            rows: Matrix rows of the cards to score
+
+        Returns:
+            float32 array (N, len(rows)); 0 where a set matches no columns
+        """
+        candidate_sets = []
+        for cats in category_sets:
+            term, fallback = self.columns_for_categories(list(cats))
+            candidate_sets.append(term or fallback)
+        table = self._masked_max(self.values[list(rows)], self._column_mask(candidate_sets))
+        table[np.isneginf(table)] = 0.0
+        return table
+
+    def _column_mask(self, column_sets: Sequence[Sequence[int]]) -> np.ndarray:
+        mask = np.zeros((len(column_sets), len(self.columns)), dtype=bool)
+        for n, columns in enumerate(column_sets):
+            mask[n, columns] = True
+        return mask
+
+    @staticmethod
+    def _masked_max(values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """
+        Computes out[n, c] = max(values[c, mask[n]]) for every mask row.
+
+        Rows of mask with no True entries yield -inf. Work is chunked over
+        mask rows to bound the temporary (chunk x cards x columns) array.
+        """
+        n_sets = mask.shape[0]
+        n_cards, n_columns = values.shape
+        out = np.full((n_sets, n_cards), -np.inf, dtype=np.float32)
+        if n_sets == 0 or n_cards == 0 or n_columns == 0:
+            return out
+        chunk = max(1, _BATCH_CHUNK_ELEMENTS // (n_cards * n_columns))
+        for start in range(0, n_sets, chunk):
+            block = mask[start : start + chunk]
+            masked = np.where(block[:, None, :], values[None, :, :], np.float32(-np.inf))
+            out[start : start + chunk] = masked.max(axis=2)
+        return out
+
+
+def _from_snapshot(name: str) -> property:
+    return property(lambda self: getattr(self._snapshot, name), doc=f"{name} of the current snapshot")
+
+
+class RewardsMatrix:
+    """
+    Cleaned, numeric view of card_rewards_matrix.csv.
+
+    Every call is answered from one MatrixSnapshot (the current one when the
+    call starts); load() and the update methods publish a new snapshot.
+    Callers that need several reads to agree can hold matrix.snapshot.
+
+    Attributes:
+        path: Path to the source CSV
+        source_path: File the values were read from (the CSV or its .rmx)
+        result_cache: Memoized rank_categories() results for this content
+        card_names, columns, values, card_index, column_index,
+        category_index, content_hash: Those of the current snapshot
+    """
+
+    card_names = _from_snapshot("card_names")
+    columns = _from_snapshot("columns")
+    values = _from_snapshot("values")
+    card_index = _from_snapshot("card_index")
+    column_index = _from_snapshot("column_index")
+    category_index = _from_snapshot("category_index")
+    content_hash = _from_snapshot("content_hash")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime_ns: Optional[int] = None
+        self.source_path = path
+        self.result_cache = ResultCache()
+        self._update_lock = threading.Lock()
+        self._snapshot = MatrixSnapshot([], [], np.zeros((0, 0), dtype=np.float32), content_hash="")
+        self.load()
+
+    @property
+    def snapshot(self) -> MatrixSnapshot:
+        return self._snapshot
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+    @metrics.timed("matrix_load")
+    def load(self) -> None:
+        """Loads the matrix (binary artifact if available) and publishes it as a new snapshot."""
+        mtime_ns = os.stat(self.path).st_mtime_ns
+        binary_path = _binary_source(self.path)
+        if binary_path is not None:
+            header, values = read_matrix_binary(binary_path)
+            snapshot = MatrixSnapshot(
+                header["card_names"], header["columns"], values, header["content_hash"]
+            )
+            source_path = binary_path
+        else:
+            snapshot = MatrixSnapshot(*_load_csv(self.path))
+            source_path = self.path
+        with self._update_lock:
+            if snapshot.content_hash != self._snapshot.content_hash:
+                self.result_cache.clear(snapshot.generation)
+            else:
+                self.result_cache.rekey(lambda key: key, snapshot.generation)
+            self._snapshot = snapshot
+            self.source_path = source_path
+            self.mtime_ns = mtime_ns
+
+    def is_stale(self) -> bool:
+        """True if the CSV on disk changed since it was loaded."""
+        try:
+            return os.stat(self.path).st_mtime_ns != self.mtime_ns
+        except FileNotFoundError:
+            return False
+
+    def refresh(self) -> bool:
+        """
+        Reloads the matrix in place if the CSV changed on disk.
+
+        Returns:
+            True if the matrix was reloaded
+        """
+        if not self.is_stale():
+            return False
+        self.load()
+        return True
+
+    # ------------------------------------------------------------------
+    # Incremental updates
+    # ------------------------------------------------------------------
+    # Each update builds a new snapshot from the current one (copying the
+    # arrays it changes and patching only the affected index entries),
+    # publishes it with a single reference swap and evicts only the cached
+    # rankings that read a changed cell; everything else stays warm. Writers
+    # are serialized by _update_lock. Each method returns the number of
+    # cached results evicted.
+
+    @staticmethod
+    def _candidate_columns(snapshot: MatrixSnapshot, categories: frozenset, memo: Dict) -> set:
+        entry = memo.get(categories)
+        if entry is None:
+            term, fallback = snapshot.columns_for_categories(sorted(categories))
+            entry = memo[categories] = set(term or fallback)
+        return entry
+
+    def _publish(self, snapshot: MatrixSnapshot, rekey) -> int:
+        # Re-key and move the cache to the new generation before readers can
+        # see the snapshot; results still being computed from the previous
+        # one are then refused by put() instead of outliving the eviction
+        evicted = self.result_cache.rekey(rekey, snapshot.generation)
+        self._snapshot = snapshot
+        metrics.incr("matrix_updates")
+        metrics.incr("result_cache_invalidations", evicted)
+        return evicted
+
+    def set_rate(self, card_name: str, column: str, value: float) -> int:
+        """Changes one card's rate in one column (every row with that name)."""
+        with self._update_lock:
+            current = self._snapshot
+            rows = current.rows_for(card_name)
+            j = current.column_for(column)
+            value = np.float32(value)
+            if all(current.values[r, j] == value for r in rows):
+                return 0
+            values = np.array(current.values)
+            values[rows, j] = value
+
+            changed = set(rows)
+            memo: Dict = {}
+            return self._publish(
+                current.replace(values=values),
+                lambda key: None
+                if changed.intersection(key[1]) and j in self._candidate_columns(current, key[0], memo)
+                else key,
+            )
+
+    def add_card(self, card_name: str, rates: Optional[Dict[str, float]] = None) -> int:
+        """Appends a card row; columns missing from rates are 0."""
+        with self._update_lock:
+            current = self._snapshot
+            row = np.zeros((1, len(current.columns)), dtype=np.float32)
+            for column, value in (rates or {}).items():
+                row[0, current.column_for(column)] = value
+            card_names = current.card_names + [card_name]
+            lowered = card_name.lower()
+            previous_rows = set(current.card_index.get(lowered, []))
+            card_index = dict(current.card_index)
+            card_index[lowered] = sorted(previous_rows) + [len(card_names) - 1]
+
+            # Whitelists naming this card used to report it missing (or, for a
+            # duplicate name, resolved to fewer rows)
+            return self._publish(
+                current.replace(
+                    values=np.vstack([current.values, row]),
+                    card_names=card_names,
+                    card_index=card_index,
+                ),
+                lambda key: None
+                if previous_rows.intersection(key[1]) or any(m.lower() == lowered for m in key[2])
+                else key,
+            )
+
+    def remove_card(self, card_name: str) -> int:
+        """Removes every row with this card name; later rows shift up."""
+        with self._update_lock:
+            current = self._snapshot
+            removed = sorted(current.rows_for(card_name))
+            removed_set = set(removed)
+            card_names = [n for r, n in enumerate(current.card_names) if r not in removed_set]
+            snapshot = current.replace(
+                values=np.delete(current.values, removed, axis=0),
+                card_names=card_names,
+                card_index=_card_index(card_names),
+            )
+
+            shift = np.searchsorted(np.asarray(removed), np.arange(len(current.card_names)))
+
+            def rekey(key):
+                if removed_set.intersection(key[1]):
+                    return None
+                return (key[0], tuple(int(r - shift[r]) for r in key[1]), key[2], key[3])
+
+            return self._publish(snapshot, rekey)
+
+    def add_column(self, column: str, rates: Optional[Dict[str, float]] = None) -> int:
+        """
+        Appends a reward column (e.g. a new quarterly category); cards
+        missing from rates are 0. Category index entries whose search terms
+        match the new column gain it.
+        """
+        with self._update_lock:
+            current = self._snapshot
+            if column in current.column_index:
+                raise ValueError(f"Reward column already exists: {column!r}")
+            values = np.zeros((len(current.card_names), 1), dtype=np.float32)
+            for card_name, value in (rates or {}).items():
+                values[current.rows_for(card_name), 0] = value
+            j = len(current.columns)
+            lowered = column.lower()
+
+            fallback_changed = any(keyword in lowered for keyword in FALLBACK_KEYWORDS)
+            fallback_columns = current._fallback_columns + ([j] if fallback_changed else [])
+            changed = set()
+            category_index = {}
+            # Copy first: readers of the current snapshot may still be adding memo entries
+            for key, (term, _) in dict(current.category_index).items():
+                # build_search_terms only ever adds terms that contain the
+                # category, so testing the new column on its own is enough
+                terms = build_search_terms(key, [column])
+                if any(t.lower() in lowered for t in terms):
+                    term = term + [j]
+                    changed.add(key)
+                category_index[key] = (term, fallback_columns)
+            snapshot = current.replace(
+                values=np.hstack([current.values, values]),
+                columns=current.columns + [column],
+                column_index={**current.column_index, column: j},
+                _columns_lower=current._columns_lower + [lowered],
+                _fallback_columns=fallback_columns,
+                category_index=category_index,
+            )
+
+            def affected(key) -> bool:
+                if changed.intersection(key[0]):
+                    return True
+                return fallback_changed and not snapshot.columns_for_categories(sorted(key[0]))[0]
+
+            return self._publish(snapshot, lambda key: None if affected(key) else key)
+
+    def apply_updates(self, updates: Sequence[dict]) -> int:
+        """
+        Applies a list of deltas in order, e.g. parsed from JSON:
+            {"op": "set", "card": ..., "column": ..., "value": 5}
+            {"op": "add_card", "card": ..., "rates": {column: rate}}
+            {"op": "remove_card", "card": ...}
+            {"op": "add_column", "column": ..., "rates": {card: rate}}
+
+        Returns:
+            Total number of cached results evicted
+        """
+        evicted = 0
+        for update in updates:
+            op = update.get("op")
+            if op == "set":
+                evicted += self.set_rate(update["card"], update["column"], update["value"])
+            elif op == "add_card":
+                evicted += self.add_card(update["card"], update.get("rates"))
+            elif op == "remove_card":
+                evicted += self.remove_card(update["card"])
+            elif op == "add_column":
+                evicted += self.add_column(update["column"], update.get("rates"))
+            else:
+                raise ValueError(f"Unknown matrix update op: {op!r}")
+        return evicted
+
+    # ------------------------------------------------------------------
+    # Lookups (each answered from the snapshot current at the call)
+    # ------------------------------------------------------------------
+    def match_columns(self, search_terms: Sequence[str]) -> List[int]:
+        return self._snapshot.match_columns(search_terms)
+
+    def category_columns(self, category: str) -> Tuple[List[int], List[int]]:
+        return self._snapshot.category_columns(category)
+
+    def columns_for_categories(self, categories: Sequence[str]) -> Tuple[List[int], List[int]]:
+        return self._snapshot.columns_for_categories(categories)
+
+    def select_rows(self, card_whitelist: Optional[Sequence[str]]) -> Tuple[List[int], List[str]]:
+        return self._snapshot.select_rows(card_whitelist)
+
+    def offer_text(self, row: int, columns: Sequence[int]) -> str:
+        return self._snapshot.offer_text(row, columns)
+
+    def offer_texts(self, rows: Sequence[int], columns: Sequence[int]) -> List[str]:
+        return self._snapshot.offer_texts(rows, columns)
+
+    def rank(
+        self,
+        search_terms: Sequence[str],
+        card_whitelist: Optional[Sequence[str]] = None,
+        top_n: int = 20,
+    ) -> List[Tuple[str, float, str]]:
+        """See MatrixSnapshot.rank."""
+        return self._snapshot.rank(search_terms, card_whitelist, top_n)
+
+    @metrics.timed("rank")
+    def rank_categories(
+        self,
+        categories: Sequence[str],
+        card_whitelist: Optional[Sequence[str]] = None,
+        top_n: int = 20,
+    ) -> List[Tuple[str, float, str]]:
+        """
+        Same as rank(), with columns taken from the category index instead of
+        scanning column names. Results are memoized in result_cache.
+        """
+        snapshot = self._snapshot
+        generation = snapshot.generation
+        rows, missing = snapshot.select_rows(card_whitelist)
+        # Canonical key: the result depends only on the resolved category set,
+        # the selected rows (plus missing names, which are echoed back) and top_n
+        key = (
+            frozenset((c or "").strip().lower() for c in categories),
+            tuple(rows),
+            tuple(missing),
+            top_n,
+        )
+        metrics.incr("rank_calls")
+        cached = self.result_cache.get(key, generation)
+        if cached is not None:
+            metrics.incr("rank_cache_hits")
+            return list(cached)
+        term_columns, fallback_columns = snapshot.columns_for_categories(categories)
+        results = snapshot.rank_columns(term_columns, fallback_columns, card_whitelist, top_n)
+        self.result_cache.put(key, tuple(results), generation)
+        return results
+
+    @metrics.timed("rank_batch")
+    def rank_batch(
+        self,
+        category_sets: Sequence[Sequence[str]],
+        card_whitelists: Sequence[Optional[Sequence[str]]],
+        top_n: int = 20,
+    ) -> List[List[List[Tuple[str, float, str]]]]:
+        """See MatrixSnapshot.rank_batch."""
+        return self._snapshot.rank_batch(category_sets, card_whitelists, top_n)
+
+    def rate_table(self, category_sets: Sequence[Sequence[str]], rows: Sequence[int]) -> np.ndarray:
+        """See MatrixSnapshot.rate_table."""
+        return self._snapshot.rate_table(category_sets, rows)
+
+
+_MATRICES: Dict[str, RewardsMatrix] = {}
+_MATRICES_LOCK = threading.Lock()
+
+
+def get_rewards_matrix(path: str, check: bool = True) -> RewardsMatrix:
+    """
+    Returns the shared RewardsMatrix for a CSV path, loading it on first use.
+
+    When the file changed since it was loaded (and check is True) a fresh
+    instance is built and swapped in; callers still holding the previous
+    instance keep a consistent view, so readers on other threads are never
+    exposed to a half-reloaded matrix.
+    """
+    key = os.path.abspath(path)
+    matrix = _MATRICES.get(key)
+    if matrix is not None and not (check and matrix.is_stale()):
+        return matrix
+    with _MATRICES_LOCK:
+        previous = _MATRICES.get(key)
+        if previous is None or (check and previous.is_stale()):
+            matrix = RewardsMatrix(path)
+            _carry_result_cache(previous, matrix)
+            _MATRICES[key] = matrix
+        else:
+            matrix = previous
+    return matrix
+
+
+def _carry_result_cache(previous: Optional[RewardsMatrix], matrix: RewardsMatrix) -> None:
+    """Keeps cached results across a reload that did not change the content."""
+    if previous is not None and previous.content_hash == matrix.content_hash:
+        previous.result_cache.rekey(lambda key: key, matrix.snapshot.generation)
+        matrix.result_cache = previous.result_cache
+
+
+def reload_rewards_matrix(path: str) -> RewardsMatrix:
+    """Loads path unconditionally and swaps it in as the shared instance."""
+    matrix = RewardsMatrix(path)
+    with _MATRICES_LOCK:
+        key = os.path.abspath(path)
+        _carry_result_cache(_MATRICES.get(key), matrix)
+        _MATRICES[key] = matrix
+    return matrix
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compile a rewards matrix CSV to the binary format.")
+    parser.add_argument("csv", help="Rewards matrix CSV")
+    parser.add_argument("-o", "--output", help=f"Output path (default: <csv stem>{MATRIX_BINARY_SUFFIX})")
+    args = parser.parse_args(argv)
+
+    out_path = compile_matrix(args.csv, args.output)
+    header, _ = read_matrix_binary(out_path)
+    print(f"Wrote {out_path}: {header['n_cards']} cards x {header['n_columns']} columns")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,358 @@
+"""
+Long-running recommendation server.
+
+Keeps the rewards matrix, its category index, the brand/fuzzy mapping
+tables and the Places cache warm in memory and serves recommendations over
+HTTP. Requests are handled concurrently on a thread per connection.
+
+Endpoints:
+    GET  /recommend?place=Starbucks&cards=...&cards=...[&types=cafe][&top_n=5]
+    GET  /categories?category=Dining[&category=...]&cards=...[&top_n=5]
+    GET  /health
+    GET  /metrics     (Prometheus text; populated when started with --metrics)
+    POST /reload
+    POST /update      (JSON list of matrix deltas, see RewardsMatrix.apply_updates)
+
+The POST endpoints change live state, so they are disabled unless the
+server is started with an admin token (--admin-token or the
+CARDGENIUS_ADMIN_TOKEN environment variable), and then require
+"Authorization: Bearer <token>".
+
+`cards` may be repeated or "|"-separated; without it USER_CARDS is used.
+The matrix file is polled in the background and a changed file is loaded
+into a new instance that is swapped in atomically, so in-flight requests
+finish on the old matrix and no request pays the reload cost.
+
+Usage:
+    python server.py --port 8765 --matrix ../src/data/card_rewards_matrix.csv
+"""
+
+import argparse
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import metrics
+from bulk import format_cards
+from map import USER_CARDS, categories_for_place
+from rewards_matrix import get_rewards_matrix, reload_rewards_matrix
+
+DEFAULT_PORT = 8765
+DEFAULT_RELOAD_INTERVAL = 5.0
+DEFAULT_TOP_N = 5
+ADMIN_TOKEN_ENV = "CARDGENIUS_ADMIN_TOKEN"
+
+
+class BadRequest(Exception):
+    """Invalid query parameters; reported to the client as HTTP 400."""
+
+
+class RecommendationService:
+    """
+    Warm recommendation state shared by all request threads.
+
+    Args:
+        matrix_csv_path: Path to rewards matrix CSV
+        places_client: Optional PlacesClient for resolving free-text places;
+            without one the place text is mapped directly as a place name
+        reload_interval: Seconds between matrix file checks (0 disables)
+    """
+
+    def __init__(
+        self,
+        matrix_csv_path: str,
+        places_client=None,
+        reload_interval: float = DEFAULT_RELOAD_INTERVAL,
+    ):
+        self.matrix_csv_path = matrix_csv_path
+        self.places_client = places_client
+        self.reload_interval = reload_interval
+        self.started_at = time.time()
+        self.reloads = 0
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._matrix = get_rewards_matrix(matrix_csv_path)
+
+    @property
+    def matrix(self):
+        return self._matrix
+
+    def reload(self, force: bool = False) -> bool:
+        """Swaps in a freshly loaded matrix if the file changed (or if forced)."""
+        current = self._matrix
+        if not force and not current.is_stale():
+            return False
+        if force:
+            fresh = reload_rewards_matrix(self.matrix_csv_path)
+        else:
+            fresh = get_rewards_matrix(self.matrix_csv_path)
+        self._matrix = fresh
+        self.reloads += 1
+        return True
+
+    def update(self, updates: List[dict]) -> Dict:
+        """Applies matrix deltas to the live matrix, keeping unaffected cached results."""
+        matrix = self._matrix
+        evicted = matrix.apply_updates(updates)
+        return {"applied": len(updates), "evicted": evicted, "matrix_hash": matrix.content_hash}
+
+    def start_watcher(self) -> None:
+        if self.reload_interval <= 0 or self._watcher is not None:
+            return
+
+        def watch():
+            while not self._stop.wait(self.reload_interval):
+                try:
+                    self.reload()
+                except Exception as exc:  # keep serving the last good matrix
+                    print(f"Matrix reload failed: {exc}", file=sys.stderr)
+
+        self._watcher = threading.Thread(target=watch, name="matrix-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def recommend_categories(
+        self, categories: List[str], cards: Optional[List[str]], top_n: int
+    ) -> Dict:
+        matrix = self._matrix
+        results = matrix.rank_categories(categories, card_whitelist=cards or USER_CARDS, top_n=top_n)
+        return {"categories": categories, "top_cards": format_cards(results)}
+
+    def recommend_place(
+        self, place_text: str, types: List[str], cards: Optional[List[str]], top_n: int
+    ) -> Dict:
+        if self.places_client is not None:
+            place = self.places_client.lookup(place_text)
+            if place is None:
+                return {"query": place_text, "place": None, "categories": [], "top_cards": []}
+        else:
+            place = {"name": place_text, "types": types}
+        categories = categories_for_place(place.get("name", ""), place.get("types", []))
+        response = {"query": place_text, "place": place}
+        response.update(self.recommend_categories(categories, cards, top_n))
+        return response
+
+    def health(self) -> Dict:
+        matrix = self._matrix
+        health = {
+            "status": "ok",
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "matrix_path": os.path.abspath(self.matrix_csv_path),
+            "matrix_mtime_ns": matrix.mtime_ns,
+            "cards": len(matrix.card_names),
+            "columns": len(matrix.columns),
+            "matrix_hash": matrix.content_hash,
+            "reloads": self.reloads,
+            "result_cache": matrix.result_cache.stats(),
+        }
+        if self.places_client is not None and self.places_client.cache is not None:
+            health["places_cache"] = self.places_client.cache.stats()
+        return health
+
+
+def _cards_param(query: Dict[str, List[str]]) -> Optional[List[str]]:
+    cards = [name.strip() for value in query.get("cards", []) for name in value.split("|")]
+    return [name for name in cards if name] or None
+
+
+def _top_n_param(query: Dict[str, List[str]]) -> int:
+    raw = query.get("top_n", [str(DEFAULT_TOP_N)])[0]
+    try:
+        top_n = int(raw)
+    except ValueError:
+        raise BadRequest(f"top_n must be an integer, got {raw!r}")
+    if top_n <= 0:
+        raise BadRequest("top_n must be positive")
+    return top_n
+
+
+def make_handler(service: RecommendationService, admin_token: Optional[str] = None):
+    """
+    Builds a request handler class bound to one service instance.
+
+    Args:
+        service: Shared recommendation state
+        admin_token: Bearer token required by POST /reload and /update
+            (None disables both endpoints)
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        server_version = "CardGeniusRecommend/1.0"
+
+        def log_message(self, format, *args):  # noqa: A002 - stdlib signature
+            pass
+
+        def _send(self, status: int, payload: Dict) -> None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_text(self, status: int, text: str) -> None:
+            body = text.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            try:
+                if url.path == "/health":
+                    self._send(200, service.health())
+                elif url.path == "/metrics":
+                    self._send_text(200, metrics.render_prometheus())
+                elif url.path == "/recommend":
+                    place = query.get("place", [""])[0].strip()
+                    if not place:
+                        raise BadRequest("missing required parameter: place")
+                    types = [t for value in query.get("types", []) for t in value.split(",") if t]
+                    self._send(200, service.recommend_place(
+                        place, types, _cards_param(query), _top_n_param(query)
+                    ))
+                elif url.path == "/categories":
+                    categories = [c for c in query.get("category", []) if c.strip()]
+                    if not categories:
+                        raise BadRequest("missing required parameter: category")
+                    self._send(200, service.recommend_categories(
+                        categories, _cards_param(query), _top_n_param(query)
+                    ))
+                else:
+                    self._send(404, {"error": f"unknown path {url.path}"})
+            except BadRequest as exc:
+                self._send(400, {"error": str(exc)})
+            except Exception as exc:
+                self._send(500, {"error": str(exc)})
+
+        def _authorized(self) -> bool:
+            if not admin_token:
+                status, error = 403, "admin endpoints are disabled (start the server with --admin-token)"
+            elif hmac.compare_digest(
+                self.headers.get("Authorization", "").encode("utf-8"),
+                f"Bearer {admin_token}".encode("utf-8"),
+            ):
+                return True
+            else:
+                status, error = 401, "missing or invalid admin token"
+            # The request body was not read; don't reuse the connection
+            self.close_connection = True
+            self._send(status, {"error": error})
+            return False
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path not in ("/update", "/reload"):
+                # The request body was not read; don't reuse the connection
+                self.close_connection = True
+                self._send(404, {"error": f"unknown path {url.path}"})
+                return
+            if not self._authorized():
+                return
+            if url.path == "/update":
+                self._post_update()
+                return
+            # /reload ignores any body it was sent, so don't reuse the connection either
+            if self.headers.get("Content-Length", "0").strip() not in ("", "0") or self.headers.get(
+                "Transfer-Encoding"
+            ):
+                self.close_connection = True
+            try:
+                reloaded = service.reload(force=True)
+            except Exception as exc:
+                self._send(500, {"error": f"reload failed: {exc}"})
+                return
+            self._send(200, {"reloaded": reloaded, **service.health()})
+
+        def _post_update(self):
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                self.close_connection = True
+                self._send(400, {"error": "invalid Content-Length"})
+                return
+            try:
+                updates = json.loads(self.rfile.read(length) or b"[]")
+                if isinstance(updates, dict):
+                    updates = [updates]
+                if not isinstance(updates, list):
+                    raise BadRequest("body must be a JSON list of updates")
+                self._send(200, service.update(updates))
+            except (BadRequest, ValueError, KeyError) as exc:
+                # Updates before the failing one stay applied
+                self._send(400, {"error": str(exc.args[0]) if exc.args else str(exc)})
+            except Exception as exc:
+                self._send(500, {"error": f"update failed: {exc}"})
+
+    return Handler
+
+
+def make_server(
+    service: RecommendationService,
+    host: str = "127.0.0.1",
+    port: int = DEFAULT_PORT,
+    admin_token: Optional[str] = None,
+) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(service, admin_token))
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Serve card recommendations over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--matrix", default="card_rewards_matrix.csv", help="Rewards matrix CSV")
+    parser.add_argument("--reload-interval", type=float, default=DEFAULT_RELOAD_INTERVAL)
+    parser.add_argument("--offline", action="store_true", help="Map place text directly, without Places lookups")
+    parser.add_argument("--metrics", action="store_true", help="Record stage timings and counters for /metrics")
+    parser.add_argument(
+        "--admin-token",
+        default=os.environ.get(ADMIN_TOKEN_ENV),
+        help=f"Bearer token enabling POST /reload and /update (default: ${ADMIN_TOKEN_ENV}; unset disables them)",
+    )
+    args = parser.parse_args(argv)
+    if args.metrics:
+        metrics.enable()
+
+    places_client = None
+    if not args.offline:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        api_key = os.environ.get("GOOGLE_PLACES_API_KEY")
+        if not api_key:
+            print("Set GOOGLE_PLACES_API_KEY first (or pass --offline).")
+            return 1
+        from places import PlacesCache, PlacesClient
+
+        places_client = PlacesClient(api_key, cache=PlacesCache())
+
+    service = RecommendationService(args.matrix, places_client, args.reload_interval)
+    service.start_watcher()
+    server = make_server(service, args.host, args.port, args.admin_token)
+    print(f"Serving recommendations on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
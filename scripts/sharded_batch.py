@@ -0,0 +1,286 @@
+"""
+Multi-process sharded batch recommendations.
+
+Splits a large set of places (or category sets) into shards and ranks them
+against every wallet on a ProcessPoolExecutor. Each worker loads the
+rewards matrix once, from the compiled .rmx artifact when one is available
+(compiled on the fly by default), so the workers memory-map the same
+read-only pages instead of each parsing the CSV. Shard results are merged
+back in input order regardless of completion order. The CLI streams: input
+is read shard by shard and each shard's records are written as soon as all
+earlier shards are done.
+
+Usage:
+    python sharded_batch.py places.csv -o results.jsonl --workers 32
+    python sharded_batch.py places.jsonl --wallets wallets.json --shard-size 4096
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from map import USER_CARDS, categories_for_place
+from rewards_matrix import _binary_source, compile_matrix, get_rewards_matrix
+
+DEFAULT_SHARD_SIZE = 2048
+
+ProgressCallback = Callable[[int, int], None]
+
+# Set in each worker process by _init_worker
+_WORKER_MATRIX_PATH: Optional[str] = None
+
+
+def _init_worker(matrix_path: str) -> None:
+    global _WORKER_MATRIX_PATH
+    _WORKER_MATRIX_PATH = matrix_path
+    get_rewards_matrix(matrix_path, check=False)
+
+
+def _rank_shard(
+    shard_index: int,
+    items: Sequence,
+    whitelists: Sequence[Sequence[str]],
+    top_n: int,
+    map_places: bool,
+) -> Tuple[int, List[List[List[Tuple[str, float, str]]]], Optional[List[List[str]]]]:
+    matrix = get_rewards_matrix(_WORKER_MATRIX_PATH, check=False)
+    if map_places:
+        category_sets = [categories_for_place(name, types) for name, types in items]
+    else:
+        category_sets = [list(cats) for cats in items]
+    results = matrix.rank_batch(category_sets, whitelists, top_n=top_n)
+    return shard_index, results, category_sets if map_places else None
+
+
+def _worker_matrix_path(matrix_csv_path: str, compile_binary: bool) -> str:
+    """The compiled artifact workers should load, compiling it if asked to."""
+    binary = _binary_source(matrix_csv_path)
+    if binary is None and compile_binary:
+        try:
+            binary = compile_matrix(matrix_csv_path)
+        except OSError:  # read-only data directory: workers parse the CSV
+            binary = None
+    return binary or matrix_csv_path
+
+
+def _whitelists(card_whitelists: Optional[Sequence[Optional[Sequence[str]]]]) -> List[List[str]]:
+    return [list(wl) if wl is not None else USER_CARDS for wl in (card_whitelists or [None])]
+
+
+def _shard_stream(
+    items: Iterable,
+    whitelists: Sequence[Sequence[str]],
+    top_n: int,
+    matrix_path: str,
+    workers: Optional[int],
+    shard_size: int,
+    map_places: bool,
+) -> Iterator[Tuple[List, List, Optional[List[List[str]]]]]:
+    """
+    Reads items lazily into shards and yields (shard, results, categories)
+    in input order as soon as every earlier shard is done. At most a few
+    shards per worker are queued or waiting to be yielded, so memory does
+    not grow with the input.
+    """
+    shard_size = max(1, shard_size)
+    max_pending = 2 * (workers or os.cpu_count() or 1)
+    pending: Deque = deque()
+    items = iter(items)
+    submitted = 0
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(matrix_path,)
+    ) as pool:
+        while True:
+            shard = list(itertools.islice(items, shard_size))
+            if shard:
+                future = pool.submit(_rank_shard, submitted, shard, whitelists, top_n, map_places)
+                pending.append((shard, future))
+                submitted += 1
+            while pending and (len(pending) >= max_pending or not shard or pending[0][1].done()):
+                head, future = pending.popleft()
+                _, shard_results, shard_categories = future.result()
+                yield head, shard_results, shard_categories
+            if not shard:
+                return
+
+
+def _run_shards(
+    items: Sequence,
+    card_whitelists: Optional[Sequence[Optional[Sequence[str]]]],
+    top_n: int,
+    matrix_csv_path: str,
+    workers: Optional[int],
+    shard_size: int,
+    progress: Optional[ProgressCallback],
+    compile_binary: bool,
+    map_places: bool,
+):
+    whitelists = _whitelists(card_whitelists)
+    matrix_path = _worker_matrix_path(matrix_csv_path, compile_binary)
+
+    merged: List = []
+    mapped: List = []
+    for shard, shard_results, shard_categories in _shard_stream(
+        items, whitelists, top_n, matrix_path, workers, shard_size, map_places
+    ):
+        merged.extend(shard_results)
+        if map_places:
+            mapped.extend(shard_categories)
+        if progress is not None:
+            progress(len(merged), len(items))
+
+    if map_places:
+        return merged, mapped
+    return merged
+
+
+def rank_sharded(
+    category_sets: Sequence[Sequence[str]],
+    card_whitelists: Optional[Sequence[Optional[Sequence[str]]]] = None,
+    top_n: int = 20,
+    matrix_csv_path: str = "card_rewards_matrix.csv",
+    workers: Optional[int] = None,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    progress: Optional[ProgressCallback] = None,
+    compile_binary: bool = True,
+) -> List[List[List[Tuple[str, float, str]]]]:
+    """
+    get_best_cards_batch across worker processes.
+
+    Args:
+        category_sets: N category lists
+        card_whitelists: M card lists (None entries use USER_CARDS; defaults to [USER_CARDS])
+        top_n: Number of top cards to return per pair
+        matrix_csv_path: Path to rewards matrix CSV
+        workers: Worker processes (defaults to os.cpu_count())
+        shard_size: Category sets per task
+        progress: Called as progress(done, total) after each finished shard
+        compile_binary: Compile a sibling .rmx first if none is current, so
+            workers memory-map it instead of parsing the CSV
+
+    Returns:
+        results[n][m], identical to get_best_cards_batch
+    """
+    return _run_shards(
+        list(category_sets), card_whitelists, top_n, matrix_csv_path,
+        workers, shard_size, progress, compile_binary, map_places=False,
+    )
+
+
+def recommend_places_sharded(
+    places: Sequence[Tuple[str, Sequence[str]]],
+    card_whitelists: Optional[Sequence[Optional[Sequence[str]]]] = None,
+    top_n: int = 20,
+    matrix_csv_path: str = "card_rewards_matrix.csv",
+    workers: Optional[int] = None,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    progress: Optional[ProgressCallback] = None,
+    compile_binary: bool = True,
+) -> Tuple[List[List[List[Tuple[str, float, str]]]], List[List[str]]]:
+    """
+    Maps (place name, types) pairs to categories and ranks them, both inside
+    the workers.
+
+    Returns:
+        (results[n][m], categories[n]) in input order
+    """
+    items = [(name or "", list(types or [])) for name, types in places]
+    return _run_shards(
+        items, card_whitelists, top_n, matrix_csv_path,
+        workers, shard_size, progress, compile_binary, map_places=True,
+    )
+
+
+def stream_places_sharded(
+    places: Iterable[Tuple[str, Sequence[str]]],
+    card_whitelists: Optional[Sequence[Optional[Sequence[str]]]] = None,
+    top_n: int = 20,
+    matrix_csv_path: str = "card_rewards_matrix.csv",
+    workers: Optional[int] = None,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    compile_binary: bool = True,
+) -> Iterator[Tuple[Tuple[str, List[str]], List[str], List[List[Tuple[str, float, str]]]]]:
+    """
+    recommend_places_sharded for inputs too large to hold in memory: places
+    are consumed lazily and results are yielded shard by shard, in input
+    order.
+
+    Yields:
+        ((name, types), categories, results per wallet) for each place
+    """
+    whitelists = _whitelists(card_whitelists)
+    matrix_path = _worker_matrix_path(matrix_csv_path, compile_binary)
+    items = ((name or "", list(types or [])) for name, types in places)
+    for shard, shard_results, shard_categories in _shard_stream(
+        items, whitelists, top_n, matrix_path, workers, shard_size, map_places=True
+    ):
+        yield from zip(shard, shard_categories, shard_results)
+
+
+def _print_progress(done: int, total: Optional[int] = None) -> None:
+    if total is None:
+        print(f"\r{done} places", end="", file=sys.stderr, flush=True)
+    else:
+        print(f"\r{done}/{total} places ({done / max(1, total):.0%})", end="", file=sys.stderr, flush=True)
+
+
+def main(argv=None) -> int:
+    from bulk import _detect_format, _row_text, _row_types, format_cards, read_rows
+
+    parser = argparse.ArgumentParser(description="Rank a large place set against wallets on all cores.")
+    parser.add_argument("input", help="CSV/JSONL of places (name/merchant/address and optional types)")
+    parser.add_argument("-o", "--output", help="Output JSONL file (default: stdout)")
+    parser.add_argument("--wallets", help="JSON file with a list of card lists (default: [USER_CARDS])")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE)
+    parser.add_argument("--top-n", type=int, default=3)
+    parser.add_argument("--matrix", default="card_rewards_matrix.csv", help="Rewards matrix CSV")
+    parser.add_argument("--no-compile", action="store_true", help="Do not write a sibling .rmx")
+    parser.add_argument("--quiet", action="store_true", help="No progress counter")
+    args = parser.parse_args(argv)
+
+    wallets = None
+    if args.wallets:
+        with open(args.wallets, encoding="utf-8") as f:
+            wallets = json.load(f)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        with open(args.input, newline="", encoding="utf-8") as f:
+            places = (
+                (_row_text(row), _row_types(row)) for row in read_rows(f, _detect_format(args.input))
+            )
+            results = stream_places_sharded(
+                places,
+                wallets,
+                top_n=args.top_n,
+                matrix_csv_path=args.matrix,
+                workers=args.workers,
+                shard_size=args.shard_size,
+                compile_binary=not args.no_compile,
+            )
+            for index, ((name, _), cats, per_wallet) in enumerate(results):
+                record: Dict = {
+                    "row": index,
+                    "input": name,
+                    "categories": cats,
+                    "top_cards": [format_cards(ranked) for ranked in per_wallet],
+                }
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                if not args.quiet and (index + 1) % args.shard_size == 0:
+                    _print_progress(index + 1)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if not args.quiet:
+        print(file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
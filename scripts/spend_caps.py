@@ -0,0 +1,390 @@
+"""
+Streaming, spend-cap-aware reward accounting.
+
+Several reward columns only earn their rate up to a spend cap, written into
+the column name ("U.S. supermarkets (up to $6k spend/yr)"). The ranking code
+treats every rate as unlimited; CapAccountant instead follows a transaction
+stream and tracks, per user, how much of each capped (card, column) pair has
+been used in the current period, so every transaction goes to the card that
+actually earns the most on it right now.
+
+For each category set and wallet card the earning options (column rates,
+best first) are laid out once. Per (user, category set) a cursor per card
+skips options whose cap is used up; caps only fill within a period, so a
+cursor only moves forward until the period rolls over, and each transaction
+costs O(1) amortized per wallet card. Cap usage and year-to-date rewards live
+in numpy arrays indexed by (user, capped slot) and user.
+
+Caps can also come from a sidecar CSV (column,cap,period) that overrides or
+adds to the parsed ones.
+
+Usage:
+    python spend_caps.py transactions.csv [--caps caps.csv] [-o ledger.jsonl]
+"""
+
+import argparse
+import csv
+import datetime as dt
+import json
+import re
+import sys
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from bulk import _row_types
+from map import USER_CARDS, categories_for_place
+from rewards_matrix import get_rewards_matrix
+
+PERIODS = ("year", "quarter", "month")
+# Rewards closer than this are treated as a tie
+_REWARD_EPSILON = 1e-9
+
+_CAP_RE = re.compile(
+    r"up to \$\s*([\d,]+(?:\.\d+)?)\s*([km])?\s*(?:in\s+)?(?:combined\s+)?(?:spend|purchases)?"
+    r"\s*(?:/|per|a|each)\s*(yr|year|qtr|quarter|mo|month)\b",
+    re.IGNORECASE,
+)
+_PERIOD_ALIASES = {"yr": "year", "year": "year", "qtr": "quarter", "quarter": "quarter", "mo": "month", "month": "month"}
+_MULTIPLIERS = {"": 1, "k": 1_000, "m": 1_000_000}
+
+DateLike = Union[None, str, dt.date, dt.datetime]
+
+
+class SpendCap(NamedTuple):
+    amount: float
+    period: str  # one of PERIODS
+
+
+def parse_spend_cap(column: str) -> Optional[SpendCap]:
+    """Reads "(up to $2M spend/yr)"-style cap metadata from a column name."""
+    match = _CAP_RE.search(column or "")
+    if match is None:
+        return None
+    number, suffix, period = match.groups()
+    amount = float(number.replace(",", "")) * _MULTIPLIERS[(suffix or "").lower()]
+    return SpendCap(amount, _PERIOD_ALIASES[period.lower()])
+
+
+def load_cap_table(path: str) -> Dict[str, Optional[SpendCap]]:
+    """
+    Sidecar caps: a CSV with column, cap and period ("year"/"quarter"/"month").
+    An empty cap marks a column as uncapped, overriding its name.
+    """
+    caps: Dict[str, Optional[SpendCap]] = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            cap = (row.get("cap") or "").replace("$", "").replace(",", "").strip()
+            period = (row.get("period") or "year").strip().lower()
+            if period not in PERIODS:
+                raise ValueError(f"Unknown cap period {period!r} for column {row.get('column')!r}")
+            caps[row["column"]] = SpendCap(float(cap), period) if cap else None
+    return caps
+
+
+def _as_date(when: DateLike) -> dt.date:
+    if when is None:
+        return dt.date.today()
+    if isinstance(when, dt.datetime):
+        return when.date()
+    if isinstance(when, dt.date):
+        return when
+    return dt.date.fromisoformat(str(when)[:10])
+
+
+def _period_key(day: dt.date, period: str) -> int:
+    if period == "year":
+        return day.year
+    if period == "quarter":
+        return day.year * 4 + (day.month - 1) // 3
+    return day.year * 12 + day.month - 1
+
+
+class _Options(NamedTuple):
+    rates: List[float]
+    slots: List[int]  # capped slot per option, -1 when uncapped
+    columns: List[int]
+
+
+class CapAccountant:
+    """
+    Running cap usage and rewards for a stream of transactions.
+
+    Args:
+        wallet: Cards to choose from (defaults to USER_CARDS)
+        matrix_csv_path: Path to rewards matrix CSV
+        caps: Column -> SpendCap (or None for uncapped) overriding the caps
+            parsed from column names
+    """
+
+    def __init__(
+        self,
+        wallet: Optional[List[str]] = None,
+        matrix_csv_path: str = "card_rewards_matrix.csv",
+        caps: Optional[Dict[str, Optional[SpendCap]]] = None,
+    ):
+        self.wallet = list(wallet) if wallet is not None else USER_CARDS
+        self.matrix = get_rewards_matrix(matrix_csv_path)
+        column_caps = {j: parse_spend_cap(col) for j, col in enumerate(self.matrix.columns)}
+        for column, cap in (caps or {}).items():
+            if column in self.matrix.column_index:
+                column_caps[self.matrix.column_index[column]] = cap
+        self.caps = {j: cap for j, cap in column_caps.items() if cap is not None}
+
+        # Matrix row per wallet card (None for cards missing from the matrix)
+        self._rows = [
+            (self.matrix.card_index.get(name.lower()) or [None])[0] for name in self.wallet
+        ]
+        # One slot per (wallet card, capped column) the card earns on
+        self._slot_index: Dict[Tuple[int, int], int] = {}
+        slot_caps: List[SpendCap] = []
+        for p, row in enumerate(self._rows):
+            if row is None:
+                continue
+            for j, cap in sorted(self.caps.items()):
+                if self.matrix.values[row, j] > 0:
+                    self._slot_index[(p, j)] = len(slot_caps)
+                    slot_caps.append(cap)
+        self._slot_amounts = np.array([cap.amount for cap in slot_caps], dtype=np.float64)
+        self._slot_periods = [cap.period for cap in slot_caps]
+
+        self._users: Dict[str, int] = {}
+        self._used = np.zeros((0, len(slot_caps)), dtype=np.float64)
+        self._used_period = np.zeros((0, len(slot_caps)), dtype=np.int64)
+        self._ytd = np.zeros(0, dtype=np.float64)
+        self._ytd_year = np.zeros(0, dtype=np.int64)
+
+        self._sets: Dict[Tuple[str, ...], int] = {}
+        self._options: List[List[_Options]] = []  # [set][wallet card]
+        self._cursors: Dict[Tuple[int, int], Tuple[int, List[int]]] = {}
+        self._mapped: Dict[Tuple[str, Tuple[str, ...]], Tuple[str, ...]] = {}
+
+    # ------------------------------------------------------------------
+    # Interning
+    # ------------------------------------------------------------------
+    def _user(self, user: str) -> int:
+        u = self._users.get(user)
+        if u is None:
+            u = self._users[user] = len(self._users)
+            if u >= len(self._ytd):
+                grow = max(16, 2 * len(self._ytd))
+                self._used = np.vstack([self._used, np.zeros((grow, self._used.shape[1]))])
+                self._used_period = np.vstack(
+                    [self._used_period, np.full((grow, self._used.shape[1]), -1, dtype=np.int64)]
+                )
+                self._ytd = np.concatenate([self._ytd, np.zeros(grow)])
+                self._ytd_year = np.concatenate([self._ytd_year, np.full(grow, -1, dtype=np.int64)])
+        return u
+
+    def _set(self, categories: Sequence[str]) -> int:
+        key = tuple(categories)
+        s = self._sets.get(key)
+        if s is not None:
+            return s
+        term, fallback = self.matrix.columns_for_categories(list(categories))
+        candidates = term or fallback
+        # The generic columns still earn once every category column is capped out
+        candidate_set = set(candidates)
+        extra = [j for j in fallback if j not in candidate_set]
+        per_card = []
+        for p, row in enumerate(self._rows):
+            options = _Options([], [], [])
+            if row is not None:
+                for group in (candidates, extra):
+                    ranked = sorted(
+                        (j for j in group if self.matrix.values[row, j] > 0),
+                        key=lambda j: -float(self.matrix.values[row, j]),
+                    )
+                    for j in ranked:
+                        slot = self._slot_index.get((p, j), -1)
+                        options.rates.append(float(self.matrix.values[row, j]))
+                        options.slots.append(slot)
+                        options.columns.append(j)
+                        if slot < 0:
+                            break  # an uncapped option absorbs everything after it
+                    if options.slots and options.slots[-1] < 0:
+                        break
+            per_card.append(options)
+        s = self._sets[key] = len(self._options)
+        self._options.append(per_card)
+        return s
+
+    def categories_for(self, name: str, types: Sequence[str] = ()) -> Tuple[str, ...]:
+        key = (name or "", tuple(types or ()))
+        cats = self._mapped.get(key)
+        if cats is None:
+            cats = self._mapped[key] = tuple(categories_for_place(key[0], list(key[1])))
+        return cats
+
+    # ------------------------------------------------------------------
+    # Cap state
+    # ------------------------------------------------------------------
+    def _remaining(self, u: int, slot: int, day: dt.date) -> float:
+        if self._used_period[u, slot] != _period_key(day, self._slot_periods[slot]):
+            return float(self._slot_amounts[slot])
+        return float(self._slot_amounts[slot] - self._used[u, slot])
+
+    def _consume(self, u: int, slot: int, day: dt.date, amount: float) -> None:
+        key = _period_key(day, self._slot_periods[slot])
+        if self._used_period[u, slot] != key:
+            self._used_period[u, slot] = key
+            self._used[u, slot] = 0.0
+        self._used[u, slot] += amount
+
+    def _cursors_for(self, u: int, s: int, day: dt.date) -> List[int]:
+        # Caps can only reset when the month changes, so cursors stay valid within one
+        stamp = day.year * 12 + day.month
+        state = self._cursors.get((u, s))
+        if state is None or state[0] != stamp:
+            state = (stamp, [0] * len(self.wallet))
+            self._cursors[(u, s)] = state
+        return state[1]
+
+    def _advance(self, u: int, options: _Options, cursor: int, day: dt.date) -> int:
+        while cursor < len(options.slots):
+            slot = options.slots[cursor]
+            if slot < 0 or self._remaining(u, slot, day) > 0:
+                break
+            cursor += 1
+        return cursor
+
+    def _quote(
+        self, u: int, options: _Options, cursor: int, day: dt.date, amount: float
+    ) -> Tuple[float, List[Tuple[int, float, float]]]:
+        """Reward for amount starting at cursor, with its (option, spend, rate) splits."""
+        reward, left, splits = 0.0, amount, []
+        for k in range(cursor, len(options.slots)):
+            if left <= 0:
+                break
+            slot = options.slots[k]
+            take = left if slot < 0 else min(left, self._remaining(u, slot, day))
+            if take <= 0:
+                continue
+            reward += take * options.rates[k] / 100
+            splits.append((k, take, options.rates[k]))
+            left -= take
+        return reward, splits
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def best_card(self, user: str, categories: Sequence[str], when: DateLike = None) -> Tuple[str, float]:
+        """The card to use now and the rate its next dollar earns, without recording anything."""
+        day = _as_date(when)
+        u, s = self._user(user), self._set(categories)
+        cursors = self._cursors_for(u, s, day)
+        best = (self.wallet[0], 0.0)
+        for p, options in enumerate(self._options[s]):
+            cursors[p] = self._advance(u, options, cursors[p], day)
+            rate = options.rates[cursors[p]] if cursors[p] < len(options.rates) else 0.0
+            if rate > best[1]:
+                best = (self.wallet[p], rate)
+        return best
+
+    def record(
+        self, user: str, categories: Sequence[str], amount: float, when: DateLike = None
+    ) -> Dict:
+        """
+        Books one transaction on the card that earns the most on it, given
+        the caps already used this period. Each user's transactions are
+        expected in date order.
+
+        Returns:
+            Dict with card, reward, rate (effective, blended across a cap
+            boundary), splits [{column, amount, rate}] and ytd_rewards
+        """
+        day = _as_date(when)
+        u, s = self._user(user), self._set(categories)
+        cursors = self._cursors_for(u, s, day)
+        best_p, best_reward, best_capped, best_splits = 0, -1.0, 0.0, []
+        for p, options in enumerate(self._options[s]):
+            cursors[p] = self._advance(u, options, cursors[p], day)
+            reward, splits = self._quote(u, options, cursors[p], day, amount)
+            capped = sum(spend for k, spend, _ in splits if options.slots[k] >= 0)
+            # Equal rewards: keep cap room for later by preferring uncapped spend
+            if reward > best_reward + _REWARD_EPSILON or (
+                reward > best_reward - _REWARD_EPSILON and capped < best_capped
+            ):
+                best_p, best_reward, best_capped, best_splits = p, reward, capped, splits
+
+        options = self._options[s][best_p]
+        for k, spend, _ in best_splits:
+            if options.slots[k] >= 0:
+                self._consume(u, options.slots[k], day, spend)
+        if self._ytd_year[u] != day.year:
+            self._ytd_year[u] = day.year
+            self._ytd[u] = 0.0
+        self._ytd[u] += best_reward
+
+        return {
+            "card": self.wallet[best_p],
+            "reward": round(best_reward, 4),
+            "rate": round(best_reward * 100 / amount, 4) if amount else 0.0,
+            "splits": [
+                {"column": self.matrix.columns[options.columns[k]], "amount": spend, "rate": rate}
+                for k, spend, rate in best_splits
+            ],
+            "ytd_rewards": round(float(self._ytd[u]), 4),
+        }
+
+    def ytd_rewards(self, user: str) -> float:
+        u = self._users.get(user)
+        return float(self._ytd[u]) if u is not None else 0.0
+
+    def cap_usage(self, user: str, when: DateLike = None) -> Dict[str, Dict[str, float]]:
+        """Current-period spend per capped (card, column) for one user."""
+        u = self._users.get(user)
+        day = _as_date(when)
+        usage: Dict[str, Dict[str, float]] = {}
+        if u is None:
+            return usage
+        for (p, j), slot in self._slot_index.items():
+            used = self._slot_amounts[slot] - self._remaining(u, slot, day)
+            if used > 0:
+                usage.setdefault(self.wallet[p], {})[self.matrix.columns[j]] = float(used)
+        return usage
+
+
+def account_transactions(
+    transactions: Iterable[dict], accountant: CapAccountant
+) -> Iterator[Dict]:
+    """
+    Streams transaction dicts (user, name/merchant, optional types or
+    categories, amount, date) through the accountant, one ledger record each.
+    """
+    for txn in transactions:
+        categories = txn.get("categories")
+        if isinstance(categories, str):
+            categories = [c for c in categories.split("|") if c]
+        if not categories:
+            categories = accountant.categories_for(txn.get("name") or txn.get("merchant") or "", _row_types(txn))
+        amount = float(str(txn.get("amount") or 0).replace(",", "").replace("$", ""))
+        record = accountant.record(str(txn.get("user") or ""), categories, amount, txn.get("date") or None)
+        record.update(user=txn.get("user") or "", amount=amount, categories=list(categories))
+        yield record
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Cap-aware card choice and YTD rewards for a transaction stream.")
+    parser.add_argument("input", help="Transactions CSV (user, merchant or name, amount, date[, types])")
+    parser.add_argument("-o", "--output", help="Output JSONL ledger (default: stdout)")
+    parser.add_argument("--caps", help="Sidecar cap table CSV (column,cap,period)")
+    parser.add_argument("--cards", nargs="+", help="Wallet card names (default: USER_CARDS)")
+    parser.add_argument("--matrix", default="card_rewards_matrix.csv", help="Rewards matrix CSV")
+    args = parser.parse_args(argv)
+
+    caps = load_cap_table(args.caps) if args.caps else None
+    accountant = CapAccountant(args.cards, args.matrix, caps)
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        with open(args.input, newline="", encoding="utf-8") as f:
+            for record in account_transactions(csv.DictReader(f), accountant):
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
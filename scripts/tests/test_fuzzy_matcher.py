@@ -0,0 +1,40 @@
+import random
+import string
+
+import pytest
+
+from map_to_category import CATEGORIES, DifflibMatcher, IndexedFuzzyMatcher
+
+
+def _variants():
+    queries = ["", "Some random gift shop", "Whole Foods Market", "AMC Theatres"]
+    for category in CATEGORIES:
+        queries += [category, category.lower(), category[:-1], category[1:], category + "s"]
+    return queries
+
+
+def _random_strings(n=2000, seed=1234):
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits + " &'-"
+    words = [w for c in CATEGORIES for w in c.split()]
+    out = []
+    for _ in range(n):
+        if rng.random() < 0.5:
+            out.append("".join(rng.choice(alphabet) for _ in range(rng.randint(1, 24))))
+        else:
+            # Category words with typos: the queries that land near the cutoff
+            text = list(" ".join(rng.sample(words, rng.randint(1, 3))))
+            for _ in range(rng.randint(0, 3)):
+                text[rng.randrange(len(text))] = rng.choice(alphabet)
+            out.append("".join(text))
+    return out
+
+
+@pytest.mark.parametrize("cutoff", [0.6, 0.8])
+def test_indexed_matcher_matches_difflib(cutoff):
+    reference = DifflibMatcher(CATEGORIES, cutoff=cutoff)
+    indexed = IndexedFuzzyMatcher(CATEGORIES, cutoff=cutoff)
+    mismatches = [
+        q for q in _variants() + _random_strings() if indexed.match(q) != reference.match(q)
+    ]
+    assert mismatches == []
@@ -0,0 +1,77 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from nearby import GeoIndex, haversine_m, nearby_recommendations
+from rewards_matrix import get_rewards_matrix
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PLACES_FIXTURE = os.path.join(HERE, "fixtures", "nearby_places.json")
+MATRIX_CSV = os.path.join(HERE, "..", "..", "src", "data", "card_rewards_matrix.csv")
+
+# Union Square, San Francisco
+CENTER = (37.7880, -122.4075)
+
+
+@pytest.fixture(scope="module")
+def index():
+    with open(PLACES_FIXTURE, encoding="utf-8") as f:
+        return GeoIndex(json.load(f))
+
+
+def _ids(index, hits):
+    return [index.places[i]["place_id"] for i, _ in hits]
+
+
+def _brute_force(index, lat, lng, radius_m):
+    distances = haversine_m(lat, lng, index.lat, index.lng)
+    return sorted((float(distances[i]), int(i)) for i in np.nonzero(distances <= radius_m)[0])
+
+
+def test_index_skips_places_without_geometry_and_duplicates(index):
+    ids = [place["place_id"] for place in index.places]
+    assert "no-geometry" not in ids
+    assert len(ids) == len(set(ids)) == 7
+
+
+@pytest.mark.parametrize("radius_m", [50, 100, 500, 1000, 3000, 20000])
+def test_query_matches_brute_force(index, radius_m):
+    hits = index.query(*CENTER, radius_m)
+    expected = _brute_force(index, *CENTER, radius_m)
+    assert [i for i, _ in hits] == [i for _, i in expected]
+    assert [d for _, d in hits] == pytest.approx([d for d, _ in expected])
+
+
+def test_query_radius_order_and_limit(index):
+    assert _ids(index, index.query(*CENTER, 1000)) == ["sf-blue-bottle", "sf-shell", "sf-whole-foods"]
+    assert _ids(index, index.query(*CENTER, 1000, limit=2)) == ["sf-blue-bottle", "sf-shell"]
+    distances = [d for _, d in index.query(*CENTER, 3000)]
+    assert distances == sorted(distances) and distances[-1] <= 3000
+    assert index.query(0.0, 0.0, 1000) == []
+
+
+def test_query_across_antimeridian(index):
+    # The two places are ~210 m apart on either side of 180 degrees
+    assert _ids(index, index.query(-16.8, 179.9995, 200)) == ["fj-east", "fj-west"]
+    assert _ids(index, index.query(-16.8, -179.9995, 200)) == ["fj-west", "fj-east"]
+    assert sorted(_ids(index, index.query(-16.8, 180.0, 150))) == ["fj-east", "fj-west"]
+    assert _ids(index, index.query(-16.8, -179.9995, 100)) == ["fj-west"]
+
+
+def test_nearby_recommendations(index):
+    wallet = get_rewards_matrix(MATRIX_CSV).card_names[:12]
+    results = nearby_recommendations(
+        index, *CENTER, radius_m=1000, card_whitelist=wallet, top_n=2, matrix_csv_path=MATRIX_CSV
+    )
+    assert [r["place"]["place_id"] for r in results] == ["sf-blue-bottle", "sf-shell", "sf-whole-foods"]
+    assert [r["distance_m"] for r in results] == [round(d, 1) for _, d in index.query(*CENTER, 1000)]
+
+    matrix = get_rewards_matrix(MATRIX_CSV)
+    for result in results:
+        expected = matrix.rank_categories(result["categories"], wallet, 2)
+        assert result["top_cards"] == [
+            {"card": card, "reward_rate": rate, "offer": offer} for card, rate, offer in expected
+        ]
+    assert nearby_recommendations(index, 0.0, 0.0, matrix_csv_path=MATRIX_CSV) == []
@@ -0,0 +1,186 @@
+import os
+import random
+import shutil
+import threading
+
+import numpy as np
+import pytest
+
+from map_to_category import BRAND_OVERRIDES, CATEGORIES
+from rewards_matrix import MatrixSnapshot, RewardsMatrix, _content_hash
+
+MATRIX_CSV = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "src", "data", "card_rewards_matrix.csv"
+)
+NEW_CARDS = ["New Card A", "New Card B"]
+
+
+@pytest.fixture
+def matrix(tmp_path):
+    # A private copy, so no compiled .rmx next to the shared CSV is picked up
+    path = tmp_path / "card_rewards_matrix.csv"
+    shutil.copy(MATRIX_CSV, path)
+    return RewardsMatrix(str(path))
+
+
+def _fresh(matrix: RewardsMatrix) -> MatrixSnapshot:
+    """A snapshot rebuilt from scratch from the matrix's current contents."""
+    return MatrixSnapshot(list(matrix.card_names), list(matrix.columns), np.array(matrix.values))
+
+
+def _rank_fresh(snapshot: MatrixSnapshot, categories, card_whitelist, top_n):
+    return snapshot.rank_columns(*snapshot.columns_for_categories(categories), card_whitelist, top_n)
+
+
+def _queries(matrix: RewardsMatrix, rng: random.Random, n: int):
+    categories = sorted(set(CATEGORIES) | set(BRAND_OVERRIDES.values())) + ["Quarterly Bonus", "Laundromat"]
+    queries = []
+    for _ in range(n):
+        whitelist = rng.sample(matrix.card_names, rng.randint(1, 6))
+        # Sometimes name a card that is missing now but may be added later
+        whitelist += rng.sample(NEW_CARDS + ["Ghost Card"], rng.randint(0, 1))
+        queries.append((rng.sample(categories, rng.randint(1, 2)), whitelist, rng.randint(1, 5)))
+    return queries
+
+
+def _mismatches(matrix: RewardsMatrix, queries):
+    fresh = _fresh(matrix)
+    return [
+        (categories, whitelist, top_n)
+        for categories, whitelist, top_n in queries
+        if matrix.rank_categories(categories, whitelist, top_n)
+        != _rank_fresh(fresh, categories, whitelist, top_n)
+    ]
+
+
+def test_random_updates_match_fresh_snapshot(matrix):
+    rng = random.Random(3)
+    queries = _queries(matrix, rng, 200)
+    for step in range(40):
+        # Warm the cache so each update has entries to keep or evict
+        for categories, whitelist, top_n in queries:
+            matrix.rank_categories(categories, whitelist, top_n)
+        op = rng.random()
+        if op < 0.5:
+            matrix.set_rate(rng.choice(matrix.card_names), rng.choice(matrix.columns), rng.choice([0, 1, 2, 3, 5, 10]))
+        elif op < 0.65:
+            matrix.add_card(rng.choice(NEW_CARDS), {rng.choice(matrix.columns): rng.choice([3, 6])})
+        elif op < 0.8:
+            matrix.remove_card(rng.choice(matrix.card_names))
+        else:
+            column = rng.choice(["Quarterly Bonus (Q%d)", "Dining extra %d", "Everywhere else %d"]) % step
+            matrix.add_column(column, {rng.choice(matrix.card_names): 7})
+        assert _mismatches(matrix, queries) == []
+        fresh = _fresh(matrix)
+        assert matrix.content_hash == _content_hash(fresh.card_names, fresh.columns, fresh.values)
+    assert matrix.result_cache.stats()["hits"] > 0
+
+
+def test_set_rate_evicts_only_affected_rankings(matrix):
+    dining = (["Dining"], matrix.card_names[:8], 3)
+    gas = (["Gas"], matrix.card_names[8:16], 3)
+    for query in (dining, gas):
+        matrix.rank_categories(*query)
+    term, _ = matrix.columns_for_categories(["Dining"])
+    assert matrix.set_rate(matrix.card_names[0], matrix.columns[term[0]], 42) == 1
+    assert len(matrix.result_cache) == 1
+    assert matrix.rank_categories(*dining)[0][:2] == (matrix.card_names[0], 42.0)
+    assert _mismatches(matrix, [dining, gas]) == []
+
+
+def test_remove_card_shifts_cached_rows(matrix):
+    rng = random.Random(7)
+    # Whitelists drawn after the removed row, so their cached rows must shift up
+    queries = [
+        (["Dining"], rng.sample(matrix.card_names[10:], 5), 3),
+        (["Travel"], rng.sample(matrix.card_names[10:], 5), 3),
+        (["Grocery"], rng.sample(matrix.card_names[10:], 5), 3),
+    ]
+    for query in queries:
+        matrix.rank_categories(*query)
+    removed = matrix.card_names[0]
+    assert all(removed not in whitelist for _, whitelist, _ in queries)
+    assert matrix.remove_card(removed) == 0
+    hits = matrix.result_cache.stats()["hits"]
+    assert _mismatches(matrix, queries) == []
+    assert matrix.result_cache.stats()["hits"] == hits + len(queries)
+
+
+def test_add_column_updates_fallback_rankings(matrix):
+    card = matrix.card_names[3]
+    query = (["Laundromat"], matrix.card_names[:10], 3)
+    # No column of its own: only the generic Everywhere columns match
+    term, fallback = matrix.columns_for_categories(["Laundromat"])
+    assert set(term) <= set(fallback)
+    matrix.rank_categories(*query)
+
+    # A new "Everywhere" column changes what categories without a column fall back to
+    assert matrix.add_column("Everywhere else (promo)", {card: 9}) == 1
+    assert matrix.rank_categories(*query)[0][:2] == (card, 9.0)
+
+    # A column named for the category replaces the fallback entirely
+    assert matrix.add_column("Laundromat (Q3)", {matrix.card_names[5]: 11}) == 1
+    assert matrix.rank_categories(*query)[0][:2] == (matrix.card_names[5], 11.0)
+    assert _mismatches(matrix, [query]) == []
+
+
+def test_snapshot_is_unaffected_by_later_updates(matrix):
+    snapshot = matrix.snapshot
+    query = (["Dining"], matrix.card_names[:8], 3)
+    before = _rank_fresh(snapshot, *query)
+    term, _ = snapshot.columns_for_categories(["Dining"])
+    matrix.set_rate(matrix.card_names[0], matrix.columns[term[0]], 42)
+    matrix.add_card("New Card A", {matrix.columns[term[0]]: 50})
+
+    assert matrix.snapshot is not snapshot
+    assert matrix.snapshot.generation > snapshot.generation
+    assert not snapshot.values.flags.writeable
+    assert _rank_fresh(snapshot, *query) == before
+
+
+def test_result_from_previous_generation_is_not_cached(matrix):
+    query = (["Dining"], matrix.card_names[:8], 3)
+    generation = matrix.snapshot.generation
+    rows, missing = matrix.select_rows(query[1])
+    key = (frozenset(["dining"]), tuple(rows), tuple(missing), query[2])
+    stale = tuple(matrix.rank_categories(*query))
+    matrix.result_cache.clear()
+
+    term, _ = matrix.columns_for_categories(["Dining"])
+    matrix.set_rate(matrix.card_names[0], matrix.columns[term[0]], 42)
+    # A reader that ranked from the old snapshot finishes after the update
+    matrix.result_cache.put(key, stale, generation)
+    assert matrix.result_cache.get(key, matrix.snapshot.generation) is None
+    assert matrix.rank_categories(*query)[0][:2] == (matrix.card_names[0], 42.0)
+
+
+def test_concurrent_reads_during_updates(matrix):
+    errors = []
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            try:
+                matrix.rank_categories(["Dining"])
+                matrix.rank_categories(["Gas"], matrix.card_names[:5] + ["X Card"])
+                matrix.rank_batch([["Dining"], ["Travel"]], [None])
+            except Exception as exc:
+                errors.append(repr(exc))
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        for i in range(100):
+            matrix.add_card("X Card", {matrix.columns[0]: 9})
+            matrix.remove_card("X Card")
+            if i % 20 == 0:
+                matrix.add_column(f"Dining Q{i}", {matrix.card_names[1]: 11})
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    assert errors == []
+    queries = [(["Dining"], None, 20), (["Gas"], matrix.card_names[:5] + ["X Card"], 20)]
+    assert _mismatches(matrix, queries) == []
@@ -0,0 +1,133 @@
+import datetime as dt
+import os
+import random
+from collections import defaultdict
+
+import pytest
+
+from spend_caps import PERIODS, CapAccountant, SpendCap, _period_key, account_transactions
+
+MATRIX_CSV = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "src", "data", "card_rewards_matrix.csv"
+)
+BLUE_CASH = "Blue Cash Preferred® Card from American Express"
+DOUBLE_CASH = "Citi Double Cash®"
+SUPERMARKETS = "U.S. supermarkets (up to $6k spend/yr)"
+
+
+def _recompute(accountant, history, user, categories, amount, day):
+    """
+    Best (reward, wallet position) for one transaction, with every cap's
+    usage summed from scratch over the booked history.
+    """
+    best_reward, best_p, best_capped = -1.0, None, 0.0
+    for p, options in enumerate(accountant._options[accountant._set(categories)]):
+        reward, left, capped = 0.0, amount, 0.0
+        for rate, slot in zip(options.rates, options.slots):
+            if left <= 0:
+                break
+            if slot < 0:
+                take = left
+            else:
+                period = _period_key(day, accountant._slot_periods[slot])
+                used = history[(user, slot, period)]
+                take = min(left, accountant._slot_amounts[slot] - used)
+                if take <= 0:
+                    continue
+                capped += take
+            reward += take * rate / 100
+            left -= take
+        if reward > best_reward + 1e-9 or (reward > best_reward - 1e-9 and capped < best_capped):
+            best_reward, best_p, best_capped = reward, p, capped
+    return best_reward, best_p
+
+
+def test_matches_recomputation_from_scratch():
+    rng = random.Random(5)
+    probe = CapAccountant([], MATRIX_CSV)
+    # Small caps with every period, so caps fill and roll over often
+    caps = {
+        probe.matrix.columns[j]: SpendCap(rng.choice([50, 200, 500]), rng.choice(PERIODS))
+        for j in probe.caps
+    }
+    # Cards earning on a capped column; listed once each, since splits are booked by wallet position
+    capped_cards = sorted({
+        name for name in probe.matrix.card_names
+        if name not in (BLUE_CASH, DOUBLE_CASH)
+        and any(probe.matrix.values[probe.matrix.card_index[name.lower()][0], j] > 0 for j in probe.caps)
+    })
+    accountant = CapAccountant(capped_cards[:6] + [BLUE_CASH, DOUBLE_CASH], MATRIX_CSV, caps)
+    category_sets = [
+        ["U.S. supermarkets"], ["Grocery"], ["Gas"], ["Dining", "Restaurants"], ["Everywhere"],
+        ["Other purchases"], ["Electronics retailers"], ["Shipping providers"], ["Airlines"],
+    ]
+
+    history = defaultdict(float)  # (user, slot, period key) -> spend
+    day = dt.date(2025, 1, 1)
+    split_records = month_changes = 0
+    for _ in range(3000):
+        step = rng.choice([0, 0, 1, 3])
+        month_changes += (day + dt.timedelta(days=step)).month != day.month
+        day += dt.timedelta(days=step)
+        user, categories, amount = rng.choice("ab"), rng.choice(category_sets), round(rng.uniform(1, 150), 2)
+
+        expected_reward, expected_p = _recompute(accountant, history, user, categories, amount, day)
+        record = accountant.record(user, categories, amount, day)
+        assert record["card"] == accountant.wallet[expected_p]
+        assert record["reward"] == pytest.approx(expected_reward, abs=1e-3)
+
+        p = accountant.wallet.index(record["card"])
+        split_records += len(record["splits"]) > 1
+        for split in record["splits"]:
+            slot = accountant._slot_index.get((p, accountant.matrix.column_index[split["column"]]), -1)
+            if slot >= 0:
+                history[(user, slot, _period_key(day, accountant._slot_periods[slot]))] += split["amount"]
+
+    # The stream has to exercise cap boundaries and period rollovers to mean anything
+    assert split_records > 50
+    assert month_changes >= 12
+
+
+def test_cap_boundary_split_and_month_reset():
+    accountant = CapAccountant(
+        [BLUE_CASH, DOUBLE_CASH], MATRIX_CSV, caps={SUPERMARKETS: SpendCap(100, "month")}
+    )
+    categories = ["U.S. supermarkets"]
+
+    first = accountant.record("a", categories, 60, "2025-01-05")
+    assert (first["card"], first["reward"]) == (BLUE_CASH, 3.6)
+
+    # 40 left under the cap at 6%, the rest at the card's 1% Everywhere rate
+    split = accountant.record("a", categories, 60, "2025-01-20")
+    assert split["card"] == BLUE_CASH
+    assert [(s["column"], s["amount"], s["rate"]) for s in split["splits"]] == [
+        (SUPERMARKETS, 40, 6.0), ("Everywhere", 20, 1.0),
+    ]
+    assert split["reward"] == pytest.approx(2.6)
+    assert accountant.cap_usage("a", "2025-01-20") == {BLUE_CASH: {SUPERMARKETS: 100.0}}
+
+    # Cap used up: 2% everywhere beats 1%
+    assert accountant.best_card("a", categories, "2025-01-25") == (DOUBLE_CASH, 2.0)
+    assert accountant.record("a", categories, 30, "2025-01-25")["card"] == DOUBLE_CASH
+    # Other users have their own caps
+    assert accountant.best_card("b", categories, "2025-01-25") == (BLUE_CASH, 6.0)
+
+    # A new month resets the cap and the cursors that skipped past it
+    assert accountant.best_card("a", categories, "2025-02-01") == (BLUE_CASH, 6.0)
+    reset = accountant.record("a", categories, 60, "2025-02-01")
+    assert (reset["card"], reset["reward"]) == (BLUE_CASH, 3.6)
+    assert accountant.ytd_rewards("a") == pytest.approx(3.6 + 2.6 + 0.6 + 3.6)
+
+
+def test_account_transactions_parses_rows():
+    accountant = CapAccountant([BLUE_CASH, DOUBLE_CASH], MATRIX_CSV)
+    records = list(account_transactions(
+        [
+            {"user": "a", "name": "Corner Market", "types": "supermarket|store", "amount": "$1,000", "date": "2025-03-01"},
+            {"user": "a", "merchant": "Anything", "categories": "Everywhere", "amount": "10", "date": "2025-03-02"},
+        ],
+        accountant,
+    ))
+    assert records[0]["amount"] == 1000.0
+    assert records[0]["categories"] == list(accountant.categories_for("Corner Market", ["supermarket", "store"]))
+    assert (records[1]["categories"], records[1]["card"]) == (["Everywhere"], DOUBLE_CASH)
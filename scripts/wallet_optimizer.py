@@ -0,0 +1,260 @@
+"""
+Spend-weighted wallet optimizer over a transaction history.
+
+Transactions are mapped to reward categories with categories_for_place and
+their spend is aggregated per category set first, so every later step works
+on a small (category sets x cards) rate table instead of on transactions:
+
+- score_wallet: which card to use for each transaction and the total
+  rewards a wallet earns on the history
+- optimize_wallet: the k-card subset of a catalog that maximizes rewards,
+  found by branch-and-bound
+
+Rewards are amount * rate / 100, the same percentage reading of the matrix
+used in offer text ("4% — Dining").
+"""
+
+import heapq
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from map import USER_CARDS, categories_for_place
+from rewards_matrix import get_rewards_matrix
+
+
+class SpendProfile:
+    """
+    A transaction history reduced to spend per category set.
+
+    Args:
+        transactions: Dicts with "name" (or "merchant"), "amount" and optional
+            "types", or (name, types, amount) tuples
+    """
+
+    def __init__(self, transactions: Iterable):
+        self.category_sets: List[Tuple[str, ...]] = []
+        set_index: Dict[Tuple[str, ...], int] = {}
+        mapped: Dict[Tuple[str, Tuple[str, ...]], int] = {}
+        assignments: List[int] = []
+        amounts: List[float] = []
+        for txn in transactions:
+            name, types, amount = _unpack_transaction(txn)
+            key = (name, tuple(types))
+            s = mapped.get(key)
+            if s is None:
+                cats = tuple(categories_for_place(name, list(types)))
+                s = set_index.setdefault(cats, len(self.category_sets))
+                if s == len(self.category_sets):
+                    self.category_sets.append(cats)
+                mapped[key] = s
+            assignments.append(s)
+            amounts.append(amount)
+        self.assignments = np.asarray(assignments, dtype=np.intp)
+        self.amounts = np.asarray(amounts, dtype=np.float64)
+        self.spend = np.bincount(
+            self.assignments, weights=self.amounts, minlength=len(self.category_sets)
+        )
+
+    @property
+    def total_spend(self) -> float:
+        return float(self.amounts.sum())
+
+
+def _unpack_transaction(txn) -> Tuple[str, Sequence[str], float]:
+    if isinstance(txn, dict):
+        name = txn.get("name") or txn.get("merchant") or ""
+        return name, txn.get("types") or [], float(txn.get("amount") or 0.0)
+    name, types, amount = txn
+    return name or "", types or [], float(amount or 0.0)
+
+
+def _rate_table(
+    profile: SpendProfile, cards: Sequence[str], matrix_csv_path: str
+) -> np.ndarray:
+    """(category sets x cards) reward rates; cards missing from the matrix earn 0."""
+    matrix = get_rewards_matrix(matrix_csv_path)
+    table = np.zeros((len(profile.category_sets), len(cards)), dtype=np.float64)
+    present = [(i, matrix.card_index[name.lower()][0]) for i, name in enumerate(cards)
+               if name.lower() in matrix.card_index]
+    if present and profile.category_sets:
+        positions, rows = zip(*present)
+        table[:, list(positions)] = matrix.rate_table(profile.category_sets, rows)
+    return table
+
+
+def score_wallet(
+    profile: SpendProfile,
+    wallet: Optional[List[str]] = None,
+    matrix_csv_path: str = "card_rewards_matrix.csv",
+) -> Dict:
+    """
+    Picks the best wallet card for every transaction.
+
+    Returns:
+        Dict with total_spend, total_rewards, per_transaction
+        [(card, rate, reward)] in input order and per_category
+        {category set label: {"spend", "card", "rate", "rewards"}}
+    """
+    wallet = wallet if wallet is not None else USER_CARDS
+    if not wallet:
+        raise ValueError("wallet must contain at least one card")
+    rates = _rate_table(profile, wallet, matrix_csv_path)
+    best = rates.argmax(axis=1) if len(profile.category_sets) else np.zeros(0, dtype=np.intp)
+    best_rate = rates[np.arange(len(best)), best]
+
+    txn_rates = best_rate[profile.assignments]
+    txn_rewards = profile.amounts * txn_rates / 100
+    per_transaction = [
+        (wallet[best[s]], float(rate), float(reward))
+        for s, rate, reward in zip(profile.assignments, txn_rates, txn_rewards)
+    ]
+    per_category = {
+        " / ".join(cats): {
+            "spend": float(profile.spend[s]),
+            "card": wallet[best[s]],
+            "rate": float(best_rate[s]),
+            "rewards": float(profile.spend[s] * best_rate[s] / 100),
+        }
+        for s, cats in enumerate(profile.category_sets)
+    }
+    return {
+        "total_spend": profile.total_spend,
+        "total_rewards": float(txn_rewards.sum()),
+        "per_transaction": per_transaction,
+        "per_category": per_category,
+    }
+
+
+def _prune_dominated(rates: np.ndarray) -> List[int]:
+    """
+    Drops cards whose rate is <= another card's in every category set; an
+    optimal k-subset never needs them. Exact duplicates keep the first card.
+    """
+    # A dominating card has a total at least as large, so visit by total first
+    order = np.argsort(-rates.sum(axis=0), kind="stable")
+    kept: List[int] = []
+    for c in order:
+        if kept and np.all(rates[:, kept] >= rates[:, [c]], axis=0).any():
+            continue
+        kept.append(int(c))
+    return sorted(kept)
+
+
+def _suffix_top_sums(values: np.ndarray, r: int) -> np.ndarray:
+    """out[i] = sum of the r largest entries of values[i + 1:]."""
+    n = len(values)
+    out = np.zeros(n)
+    if r <= 0 or n < 2:
+        return out
+    if r == 1:
+        out[:-1] = np.maximum.accumulate(values[::-1])[::-1][1:]
+        return out
+    heap: List[float] = []
+    total = 0.0
+    for i in range(n - 1, 0, -1):
+        v = float(values[i])
+        if len(heap) < r:
+            heapq.heappush(heap, v)
+            total += v
+        elif v > heap[0]:
+            total += v - heapq.heapreplace(heap, v)
+        out[i - 1] = total
+    return out
+
+
+def best_subset(rates: np.ndarray, spend: np.ndarray, k: int) -> Tuple[List[int], float, int]:
+    """
+    Exact max of sum_s spend[s] * max_{c in W} rates[s, c] over |W| <= k.
+
+    Branch-and-bound over cards sorted by standalone value, each branch only
+    adding cards later in that order. The objective is monotone submodular
+    (a facility-location function), so a partial wallet's value plus the r
+    largest marginal gains still available to it bounds every completion
+    with r more cards; branches whose bound cannot beat the incumbent are
+    never expanded. The greedy solution seeds the incumbent.
+
+    Returns:
+        (chosen column indices, objective value, nodes expanded); fewer than
+        k columns are returned when extra cards would add nothing
+    """
+    n_sets, n_cards = rates.shape
+    k = min(k, n_cards)
+    if k <= 0 or n_cards == 0:
+        return [], 0.0, 0
+    weighted = rates * spend[:, None]
+    # Strong cards first makes the "later cards only" bounds tight quickly
+    perm = np.argsort(-weighted.sum(axis=0), kind="stable")
+    weighted = weighted[:, perm]
+
+    def gains(current: np.ndarray, start: int) -> np.ndarray:
+        return np.maximum(weighted[:, start:] - current[:, None], 0.0).sum(axis=0)
+
+    # Greedy incumbent
+    current = np.zeros(n_sets)
+    greedy: List[int] = []
+    for _ in range(k):
+        g = gains(current, 0)
+        g[greedy] = -1.0
+        pick = int(np.argmax(g))
+        if g[pick] <= 0:
+            break
+        greedy.append(pick)
+        current = np.maximum(current, weighted[:, pick])
+    best_value = float(current.sum())
+    best_cards = greedy
+    eps = 1e-9 * max(1.0, best_value)
+
+    nodes = 0
+    # Stack of (chosen, per-set best weighted rate, next allowed index)
+    stack = [([], np.zeros(n_sets), 0)]
+    while stack:
+        chosen, current, start = stack.pop()
+        nodes += 1
+        value = float(current.sum())
+        if value > best_value + eps:
+            best_value, best_cards = value, list(chosen)
+        remaining_picks = k - len(chosen)
+        if remaining_picks == 0 or start >= n_cards:
+            continue
+        g = gains(current, start)
+        bounds = value + g + _suffix_top_sums(g, remaining_picks - 1)
+        # Push weakest children first so the most promising one is expanded next
+        for i in np.argsort(bounds, kind="stable"):
+            if g[i] <= 0 or bounds[i] <= best_value + eps:
+                continue
+            c = start + int(i)
+            stack.append((chosen + [c], np.maximum(current, weighted[:, c]), c + 1))
+    return sorted(int(perm[c]) for c in best_cards), best_value / 100, nodes
+
+
+def optimize_wallet(
+    profile: SpendProfile,
+    k: int,
+    catalog: Optional[List[str]] = None,
+    matrix_csv_path: str = "card_rewards_matrix.csv",
+) -> Dict:
+    """
+    Finds the k-card subset of catalog that earns the most on the history.
+
+    Args:
+        profile: Aggregated transaction history
+        k: Number of cards to hold
+        catalog: Candidate cards (defaults to USER_CARDS)
+        matrix_csv_path: Path to rewards matrix CSV
+
+    Returns:
+        Dict with cards, total_rewards, total_spend, candidates (cards left
+        after dominance pruning) and nodes (branch-and-bound nodes expanded)
+    """
+    catalog = catalog if catalog is not None else USER_CARDS
+    rates = _rate_table(profile, catalog, matrix_csv_path)
+    kept = _prune_dominated(rates)
+    chosen, value, nodes = best_subset(rates[:, kept], profile.spend, k)
+    return {
+        "cards": [catalog[kept[i]] for i in chosen],
+        "total_rewards": value,
+        "total_spend": profile.total_spend,
+        "candidates": len(kept),
+        "nodes": nodes,
+    }